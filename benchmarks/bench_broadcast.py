@@ -0,0 +1,68 @@
+"""
+Measures the CPU time the server spends per broadcast, from
+`ConnectionManager.broadcast_in_game` / `broadcast_in_list` until every
+recipient's writer has handed the message to the ASGI server, for a 4-player
+game and a 5k-socket lobby.
+
+The websockets are real Starlette `WebSocket`s whose ASGI `send` encodes the
+text to UTF-8, as the server does, and discards it. Since it only uses the
+public API of the manager, compare two revisions by running it on each:
+`python benchmarks/bench_broadcast.py [broadcasts]`.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.websockets import WebSocket  # noqa: E402
+from connections import ConnectionManager, LISTING_ID  # noqa: E402
+
+GAME_ID = 1
+# A typical game log line, as broadcast by `/partial_move` and friends.
+MESSAGE = 'LOG:{"message": "Jugador 1 realizó un movimiento parcial", "time": "12:34"}'
+
+
+async def receive():
+    return {"type": "websocket.connect"}
+
+
+async def send(message):
+    if message["type"] == "websocket.send":
+        message["text"].encode("utf-8")
+
+
+def make_websocket():
+    return WebSocket({"type": "websocket", "path": "/ws/connect", "headers": []}, receive, send)
+
+
+async def measure(manager, broadcast, recipients, n_broadcasts):
+    await manager.drain()
+    start = time.process_time()
+    for _ in range(n_broadcasts):
+        await broadcast()
+        await manager.drain(recipients)
+    return (time.process_time() - start) / n_broadcasts
+
+
+async def main(n_broadcasts):
+    manager = ConnectionManager()
+    for _ in range(4):
+        socket_id = await manager.connect(make_websocket())
+        await manager.add_to_game(socket_id, GAME_ID)
+    for _ in range(5000):
+        await manager.connect(make_websocket())
+    assert len(manager.game_to_sockets[LISTING_ID]) == 5000
+
+    game = await measure(manager, lambda: manager.broadcast_in_game(GAME_ID, MESSAGE),
+                         manager.game_to_sockets[GAME_ID], n_broadcasts * 100)
+    lobby = await measure(manager, lambda: manager.broadcast_in_list(MESSAGE),
+                          manager.game_to_sockets[LISTING_ID], n_broadcasts)
+    print(f"4-player game:    {game * 1e6:9.1f} µs CPU per broadcast")
+    print(f"5000-socket lobby: {lobby * 1e3:8.2f} ms CPU per broadcast "
+          f"({lobby / 5000 * 1e6:.2f} µs per recipient)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
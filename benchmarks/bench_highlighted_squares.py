@@ -0,0 +1,60 @@
+"""
+Measures the per-call cost of computing the `highlighted_squares` field of
+`/game_state` from the figures detected in a board.
+
+    before: sum the 6x6 matrix of every Boolean Board whose code is in hand
+            into a list, then stringify it square by square.
+    after:  OR the per-code masks of `BoardFigures` and format the result.
+
+Run with `python benchmarks/bench_highlighted_squares.py [boards]`.
+"""
+import os
+import sys
+import timeit
+from random import choices, seed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from board_shapes import find_shapes, BoardFigures, figures  # noqa: E402
+from bitboard import mask_to_bits  # noqa: E402
+
+
+def highlighted_before(boolean_boards, ingame_shapes):
+    boolean_boards = [b for b in boolean_boards if b.shape_code in ingame_shapes]
+    highlighted_squares = [0 for _ in range(36)]
+    for b in boolean_boards:
+        flat_board = b.board.reshape(-1)
+        highlighted_squares = highlighted_squares + flat_board
+    return ''.join(str(x) for x in highlighted_squares)
+
+
+def highlighted_after(board_figures, ingame_shapes):
+    return mask_to_bits(board_figures.highlight(ingame_shapes))
+
+
+def main(n_boards):
+    seed(0)
+    # Skewed colors so that boards contain several figures.
+    boards = ["".join(choices("rbgy", weights=(3, 2, 1, 1), k=36)) for _ in range(n_boards)]
+    cases = []
+    for board in boards:
+        figs = BoardFigures(find_shapes(board))
+        # Every code found in the board is in some hand: worst case.
+        ingame = [b.shape_code for b in figs] + list(figures)[:6]
+        cases.append((figs, ingame, set(ingame)))
+        assert highlighted_before(figs, ingame) == highlighted_after(figs, set(ingame))
+
+    avg_figs = sum(len(c[0]) for c in cases) / len(cases)
+    print(f"{n_boards} boards, {avg_figs:.1f} figures per board on average")
+
+    for name, stmt in [("before", lambda: [highlighted_before(f, i) for f, i, _ in cases]),
+                       ("after", lambda: [highlighted_after(f, s) for f, _, s in cases])]:
+        # Warm up lazily built matrices so only the highlight step is timed.
+        stmt()
+        runs = 20
+        total = min(timeit.repeat(stmt, number=runs, repeat=5))
+        print(f"  {name:<7} {total / (runs * n_boards) * 1e6:8.2f} µs per call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,64 @@
+"""
+Measures the cold-start cost of a worker: how long `import main` takes in a
+fresh interpreter, using `python -X importtime -c "import main"`.
+
+Run from anywhere with `python benchmarks/bench_import_time.py [runs]`. The
+report shows the wall time of the import, the cumulative import time of the
+heaviest top-level packages, and whether scikit-image was loaded (it should
+only be loaded by the legacy `SKIMAGE` figure detection engine).
+"""
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement):
+    """
+    Runs `statement` in a fresh interpreter with `-X importtime` and returns
+    the wall time of the run (seconds) and a dict mapping every imported
+    module to its cumulative import time (microseconds).
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <module>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, module = line[len("import time:"):].split("|")
+        cumulative[module.strip()] = int(cum)
+    return elapsed, cumulative
+
+
+def report(statement, runs):
+    walls, tops = [], defaultdict(list)
+    for _ in range(runs):
+        wall, cumulative = import_times(statement)
+        walls.append(wall)
+        for module, cum in cumulative.items():
+            # Indentation marks nested imports; keep top-level packages only.
+            if "." not in module:
+                tops[module].append(cum)
+
+    print(f"$ python -X importtime -c {statement!r}  ({runs} runs)")
+    print(f"  wall time (median): {median(walls) * 1000:8.1f} ms")
+    print(f"  scikit-image loaded: {'skimage' in tops}")
+    heaviest = sorted(tops.items(), key=lambda x: -median(x[1]))[:8]
+    for module, cums in heaviest:
+        print(f"  {module:<20} {median(cums) / 1000:8.1f} ms")
+    print()
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    report("import main", runs)
+    # What the legacy engine adds on its first use.
+    report("import main; from skimage.measure import label, regionprops", runs)
@@ -0,0 +1,86 @@
+"""
+Measures the cost of a `/search_games` request as the game table grows.
+
+    before: read every game, filter the joinable ones in Python and scan the
+            table a second time for the games the player is in.
+    after:  fetch the player's game through `Player.game` and the requested
+            page of joinable games with a single filtered query.
+
+Games are seeded in an in-memory SQLite database; about a third of them have
+begun or are full. Run with `python benchmarks/bench_search_games.py [sizes]`,
+e.g. `python benchmarks/bench_search_games.py 1000 10000`.
+"""
+import os
+import sys
+import timeit
+from random import choice, randint, seed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pony.orm import db_session  # noqa: E402
+from orm import db, Game, Player  # noqa: E402
+from main import search_games  # noqa: E402
+from constants import PAGE_INTERVAL  # noqa: E402
+
+WORDS = ["apple", "banana", "cherry", "lobby", "switcher", "tournament", "friends", "quick"]
+
+
+def search_games_before(player_id, page=1, text="", min="", max=""):
+    """The body of `search_games` before the change, without the cursor."""
+    with db_session:
+        p = Player.get(id=player_id)
+        all_games = Game.select().order_by(Game.id)
+        games = [game for game in all_games
+                 if not game.is_init and len(game.players) < game.max_players and p not in game.players]
+        games = [game for game in games
+                 if text.lower() in game.name.lower()
+                 and (min == "" or game.min_players == int(min))
+                 and (max == "" or game.max_players == int(max))]
+        response_data = []
+        for game in all_games:
+            if p in game.players:
+                response_data.append(game.id)
+        begin = PAGE_INTERVAL * (page - 1)
+        response_data += [game.id for game in games[begin:begin + PAGE_INTERVAL]]
+        return response_data
+
+
+def seed_games(n_games):
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    seed(0)
+    with db_session:
+        for i in range(n_games):
+            max_players = randint(2, 4)
+            game = Game(name=f"{choice(WORDS)} {choice(WORDS)} {i}", max_players=max_players,
+                        is_init=(i % 7 == 0))
+            for k in range(randint(1, max_players)):
+                Player(name=f"player {k}", game=game)
+        player = Player(name="Alice", game=game)
+    return player.id
+
+
+def main(sizes):
+    queries = [("no filter", dict(text="")),
+               ("text 'apple'", dict(text="apple")),
+               ("text 'a', max 4", dict(text="a", max="4")),
+               ("few matches", dict(text="999")),
+               # Many names match but few games pass the other filters.
+               ("sparse matches", dict(text="tourn", min="3", max="3"))]
+    print(f"{'games':>7}  {'query':<16} {'before':>10} {'after':>10}")
+    for n_games in sizes:
+        player_id = seed_games(n_games)
+        for name, kwargs in queries:
+            row = []
+            for search in (search_games_before, search_games):
+                # The first request also builds the name index.
+                search(player_id, **kwargs)
+                runs = 3 if search is search_games_before else 50
+                best = min(timeit.repeat(lambda: search(player_id, **kwargs), number=runs, repeat=3))
+                row.append(best / runs * 1000)
+            print(f"{n_games:>7}  {name:<16} {row[0]:8.2f}ms {row[1]:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [1000, 10000])
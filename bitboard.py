@@ -0,0 +1,115 @@
+BOARD_SIZE = 6
+BOARD_CELLS = BOARD_SIZE * BOARD_SIZE
+COLORS = "rbgy"
+FULL_MASK = (1 << BOARD_CELLS) - 1
+
+# `_BIT_TABLES[c]` translates a board string into a string of 0s and 1s with a
+# 1 exactly where the square has color COLORS[c].
+_BIT_TABLES = [str.maketrans({x: "1" if x == c else "0" for x in COLORS}) for c in COLORS]
+# Translates the digits 1, 2, 3, 4 back into the colors they encode.
+_DIGITS_TO_COLORS = str.maketrans({str(i + 1): c for i, c in enumerate(COLORS)})
+
+
+def cell_bit(i: int, j: int) -> int:
+    """Returns the mask whose only set bit is the one of square (i, j)."""
+    return 1 << (i * BOARD_SIZE + j)
+
+
+def iter_cells(mask: int):
+    """Yields the indexes (i * 6 + j) of the set bits of `mask` in increasing order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def mask_to_bits(mask: int) -> str:
+    """
+    Returns the 36-character string of 0s and 1s whose i-th character is 1
+    iff bit i of `mask` is set, i.e. the mask in the square order of `Game.board`.
+    """
+    return format(mask, "036b")[::-1]
+
+
+class Bitboard:
+    """
+    A compact representation of the 6x6 Switcher board: four 36-bit masks,
+    one per color. Bit `i * 6 + j` of `masks[c]` is set iff the square at
+    position (i, j) has color `COLORS[c]`. Every square belongs to exactly
+    one mask.
+
+    Swapping two squares and looking up the color of a square are O(1) and
+    allocate nothing; the 36-character string used by `orm.Game` and by the
+    API is only produced when the board is serialised.
+
+    Attributes
+    ----------
+    masks : list[int]
+        The color masks, in the order given by `COLORS`.
+    """
+
+    __slots__ = ("masks",)
+
+    def __init__(self, masks):
+        self.masks = list(masks)
+
+    @classmethod
+    def from_string(cls, board: str) -> "Bitboard":
+        """
+        Parses a board in the string format of `Game.board`.
+
+        Parameters
+        ----------
+        board : str
+            A 36-character string over the alphabet `COLORS`, row by row.
+        """
+        if len(board) != BOARD_CELLS:
+            raise ValueError(f"A board has {BOARD_CELLS} squares, got {len(board)}.")
+        masks = [int(board.translate(table)[::-1], 2) for table in _BIT_TABLES]
+        if sum(bin(m).count("1") for m in masks) != BOARD_CELLS:
+            raise ValueError(f"Invalid board {board}: colors must be in {COLORS}.")
+        return cls(masks)
+
+    def to_string(self) -> str:
+        """
+        Serialises the board to the string format of `Game.board`.
+        """
+        # Write the color index + 1 of every square as a decimal digit, so the
+        # whole board is built with a handful of C-level int/str conversions.
+        digits = sum((c + 1) * int(format(mask, "036b")) for c, mask in enumerate(self.masks))
+        return str(digits).zfill(BOARD_CELLS)[::-1].translate(_DIGITS_TO_COLORS)
+
+    def __str__(self):
+        return self.to_string()
+
+    def __eq__(self, other):
+        return isinstance(other, Bitboard) and self.masks == other.masks
+
+    def copy(self) -> "Bitboard":
+        return Bitboard(self.masks)
+
+    def color_mask(self, color: str) -> int:
+        """Returns the mask of the squares of color `color`."""
+        return self.masks[COLORS.index(color)]
+
+    def color_index(self, i: int, j: int) -> int:
+        """Returns the index in `COLORS` of the color of the square at (i, j)."""
+        bit = cell_bit(i, j)
+        for c, mask in enumerate(self.masks):
+            if mask & bit:
+                return c
+        raise ValueError(f"Invalid square ({i}, {j}).")
+
+    def color_at(self, i: int, j: int) -> str:
+        """Returns the color of the square at (i, j)."""
+        return COLORS[self.color_index(i, j)]
+
+    def swap(self, i: int, j: int, k: int, l: int) -> None:
+        """
+        Swaps the squares at positions (i, j) and (k, l) in place.
+        """
+        a, b = self.color_index(i, j), self.color_index(k, l)
+        if a != b:
+            both = cell_bit(i, j) | cell_bit(k, l)
+            self.masks[a] ^= both
+            self.masks[b] ^= both
@@ -1,8 +1,16 @@
+import threading
 import numpy as np
 from random import shuffle
-from skimage.measure import label, regionprops
+from collections import OrderedDict
+from constants import FIGURE_CACHE_SIZE
+from bitboard import Bitboard, BOARD_SIZE, BOARD_CELLS, FULL_MASK, cell_bit, iter_cells
 
-BOARD_SIZE = 6
+# Figure detection engines accepted by `shapes_on_board`. The `SKIMAGE` engine
+# is the legacy one: scikit-image is slow to import, so it is only imported
+# the first time this engine is used.
+SKIMAGE = "skimage"
+BITMASK = "bitmask"
+DEFAULT_ENGINE = BITMASK
 
 # Define all figures
 figures = {
@@ -37,18 +45,78 @@ class BooleanBoard:
     """
     A Boolean Board is conceptually a pair ℬ = (α, β) with 
     α ∈ {0, 1}⁶ˣ⁶ and β the shape type (str) which represents 
-    a figure. 
+    a figure. The `mask` attribute holds α as a 36-bit integer (see
+    `bitboard.Bitboard`); the `board` attribute holds it as a read-only 6x6
+    matrix, which is only built when first accessed.
     """
 
     def __init__(self, shape, position):
-        for key, value in figures.items():
-            if any(np.array_equal(shape, rot) for rot in rotate_figure(value)):
-                self.board = construct_6x6_matrix(shape, position)
-                self.shape_code = key
-    
+        board = construct_6x6_matrix(shape, position)
+        board.flags.writeable = False
+        self.matrix = board
+        self.shape_code = FIGURE_TEMPLATES[figure_key(shape)]
+        self.mask = matrix_to_mask(board)
+
+    @classmethod
+    def from_mask(cls, mask, shape_code):
+        """
+        Builds the Boolean Board of a figure given as a 36-bit mask.
+        """
+        b = cls.__new__(cls)
+        b.matrix = None
+        b.shape_code = shape_code
+        b.mask = mask
+        return b
+
+    @property
+    def board(self):
+        if self.matrix is None:
+            self.matrix = mask_to_matrix(self.mask)
+            self.matrix.flags.writeable = False
+        return self.matrix
+
     def __str__(self):
         return f"CODIGO: {self.shape_code}\nTABLERO: {self.board}\n"
 
+
+class BoardFigures(tuple):
+    """
+    The figures found in a board: an immutable tuple of Boolean Boards,
+    indexed so that asking whether a figure covers a square is O(1).
+
+    Attributes
+    ----------
+    masks : dict[str, int]
+        Maps every shape code found in the board to the union of the masks
+        of the figures with that code.
+    """
+
+    def __new__(cls, boolean_boards=()):
+        self = super().__new__(cls, boolean_boards)
+        self.masks = {}
+        for b in self:
+            self.masks[b.shape_code] = self.masks.get(b.shape_code, 0) | b.mask
+        return self
+
+    def covers(self, shape_code, i, j):
+        """Is there a figure of type `shape_code` covering the square (i, j)?"""
+        return bool(self.masks.get(shape_code, 0) & cell_bit(i, j))
+
+    def highlight(self, shape_codes):
+        """
+        Returns the mask of all squares covered by a figure whose code is in
+        `shape_codes`.
+        """
+        mask = 0
+        for code in shape_codes:
+            mask |= self.masks.get(code, 0)
+        return mask
+
+    def figures_at(self, i, j):
+        """Returns the Boolean Boards of the figures covering the square (i, j)."""
+        bit = cell_bit(i, j)
+        return [b for b in self if b.mask & bit]
+
 def print_board(board):
     """Print the 6x6 board."""
     for row in board.reshape(BOARD_SIZE, BOARD_SIZE):
@@ -67,17 +135,49 @@ def gen_board():
     letters_to_nums = {"r": 1, "b": 2, "g": 3, "y": 4}
     return np.array([letters_to_nums[x] for x in board])
 
+def parse_board(board):
+    """
+    Turns a board, given either as a string (see `Game.board`) or as a
+    `Bitboard`, into the flat array of color numbers (1 to 4) that
+    `detect_board_figures` works with.
+    """
+    if isinstance(board, str):
+        board = Bitboard.from_string(board)
+    parsed = np.zeros(BOARD_CELLS, dtype=int)
+    for value, mask in enumerate(board.masks, start=1):
+        parsed[list(iter_cells(mask))] = value
+    return parsed
+
 def rotate_figure(figure):
     """Generate 4 rotations (90 degrees at a time) of the figure."""
     return [np.rot90(np.array(figure), k) for k in range(4)]
 
-def get_unique_figures(figures):
-    """Get unique figures by rotating and removing duplicates."""
-    all_rotations = []
-    for figure in figures.values():
-        all_rotations.extend(rotate_figure(figure))
-    unique_figures = list({tuple(map(tuple, fig)) for fig in all_rotations})
-    return [np.array(fig) for fig in unique_figures]
+def figure_key(figure):
+    """
+    Canonical, hashable key of a figure: the bytes of its boolean matrix
+    together with its dimensions. Two figures have the same key iff they
+    are equal as matrices, regardless of the integer type they were built with.
+    """
+    figure = np.asarray(figure, dtype=bool)
+    return (figure.tobytes(), figure.shape)
+
+def build_figure_templates(figures):
+    """
+    Build a mapping from the key (see `figure_key`) of every rotation of
+    every figure to the code of that figure.
+    """
+    templates = {}
+    for code, figure in figures.items():
+        for rotation in rotate_figure(figure):
+            key = figure_key(rotation)
+            if templates.get(key, code) != code:
+                raise ValueError(f"Figures {templates[key]} and {code} share a rotation.")
+            templates[key] = code
+    return templates
+
+# Built once at import: maps the key of every rotation of every figure to its code,
+# so matching a connected component is a single dictionary lookup.
+FIGURE_TEMPLATES = build_figure_templates(figures)
 
 def extract_figures(labeled_board):
     # Each connected component (CC) in the labeled board has the properties: 
@@ -85,6 +185,8 @@ def extract_figures(labeled_board):
     # slice (the slice that isolates the CC)
     # label (the label of the CC)
     # Reference: https://scikit-image.org/docs/stable/auto_examples/segmentation/plot_regionprops.html
+    from skimage.measure import regionprops
+
     figs = []
     for prop in regionprops(labeled_board):
         # Is the slice isolating the CC of the same label than the CC?
@@ -95,16 +197,16 @@ def extract_figures(labeled_board):
     return figs
 
 
-def filter_matching_figures(figures_with_positions, unique_figures):
-    """Filter figures to only include those that match the unique figures."""
+def filter_matching_figures(figures_with_positions, templates):
+    """Filter figures to only include those whose key is in `templates`."""
     return [
         (fig, position) for fig, position in figures_with_positions
-        if any(np.array_equal(fig, unique) for unique in unique_figures)
+        if figure_key(fig) in templates
     ]
 
 def detect_board_figures(board):
-    # Generate unique rotated figures
-    unique_figures = get_unique_figures(figures)
+    from skimage.measure import label
+
     board = board_to_matrix(board)
 
 
@@ -119,7 +221,7 @@ def detect_board_figures(board):
     figures_with_positions = extract_figures(labeled_board)
 
     # Filter matching figures
-    good_ones = filter_matching_figures(figures_with_positions, unique_figures)
+    good_ones = filter_matching_figures(figures_with_positions, FIGURE_TEMPLATES)
 
     return good_ones
 
@@ -137,15 +239,125 @@ def construct_6x6_matrix(figure, position):
     
     return matrix
 
-def shapes_on_board(board):
+def matrix_to_mask(matrix):
+    """Turns a 6x6 boolean matrix into a 36-bit mask."""
+    mask = 0
+    for idx in np.flatnonzero(matrix):
+        mask |= 1 << int(idx)
+    return mask
+
+def mask_to_matrix(mask):
+    """Turns a 36-bit mask into a 6x6 boolean matrix."""
+    matrix = np.zeros(BOARD_CELLS, dtype=int)
+    matrix[list(iter_cells(mask))] = 1
+    return matrix.reshape(BOARD_SIZE, BOARD_SIZE)
+
+# Squares which can be shifted one column to the right (resp. left) without
+# wrapping around to the next (resp. previous) row.
+NOT_LAST_COL = sum(cell_bit(i, j) for i in range(BOARD_SIZE) for j in range(BOARD_SIZE - 1))
+NOT_FIRST_COL = sum(cell_bit(i, j) for i in range(BOARD_SIZE) for j in range(1, BOARD_SIZE))
+
+def neighbours(mask):
+    """Returns the mask of the squares orthogonally adjacent to some square in `mask`."""
+    return ((mask << BOARD_SIZE) | (mask >> BOARD_SIZE)
+            | ((mask & NOT_LAST_COL) << 1) | ((mask & NOT_FIRST_COL) >> 1)) & FULL_MASK
+
+def flood_fill(seed, region):
+    """
+    Returns the connected component of `region` containing the squares in
+    `seed`, which must be a subset of `region`.
+    """
+    component = seed
+    while True:
+        grown = (component | neighbours(component)) & region
+        if grown == component:
+            return component
+        component = grown
+
+def connected_components(region):
+    """Yields the connected components of `region`, ordered by their first square."""
+    while region:
+        component = flood_fill(region & -region, region)
+        yield component
+        region &= ~component
+
+def build_mask_templates(figures):
+    """
+    Build a mapping from the mask of every rotation of every figure, at
+    every position in which it fits in the board, to the code of that figure.
+    """
+    templates = {}
+    for code, figure in figures.items():
+        for rotation in rotate_figure(figure):
+            rows, cols = rotation.shape
+            for i in range(BOARD_SIZE - rows + 1):
+                for j in range(BOARD_SIZE - cols + 1):
+                    templates[matrix_to_mask(construct_6x6_matrix(rotation, (i, j)))] = code
+    return templates
+
+MASK_TEMPLATES = build_mask_templates(figures)
+
+def detect_board_figures_bitmask(board):
+    """
+    Bitmask counterpart of `detect_board_figures`: flood-fills the connected
+    components of each color of a `Bitboard` and keeps those equal to some
+    figure placed somewhere in the board. Returns a list of (mask, code)
+    pairs in the same order `detect_board_figures` finds them.
+    """
+    found = []
+    for color_mask in board.masks:
+        for component in connected_components(color_mask):
+            code = MASK_TEMPLATES.get(component)
+            if code is not None:
+                found.append((component, code))
+    # skimage labels components in the order their first square appears.
+    found.sort(key=lambda x: x[0] & -x[0])
+    return found
+
+def redetect_after_swap(previous, board, i, j, k, l):
+    """
+    Incremental counterpart of `find_shapes`. Given the Boolean Boards of
+    all figures of a board (`previous`) and the `Bitboard` obtained by swapping
+    its squares (i, j) and (k, l), returns the Boolean Boards of all figures
+    of the new board.
+
+    Only the connected components touching the swapped squares or their
+    neighbours can change: figures away from them are reused, and the
+    components around them are flood-filled again.
+    """
+    dirty = cell_bit(i, j) | cell_bit(k, l)
+    dirty |= neighbours(dirty)
+
+    res = [b for b in previous if not b.mask & dirty]
+    for color_mask in board.masks:
+        seeds = color_mask & dirty
+        while seeds:
+            component = flood_fill(seeds & -seeds, color_mask)
+            seeds &= ~component
+            code = MASK_TEMPLATES.get(component)
+            if code is not None:
+                res.append(BooleanBoard.from_mask(component, code))
+    res.sort(key=lambda b: b.mask & -b.mask)
+    return res
+
+def find_shapes(board, engine=DEFAULT_ENGINE):
     '''
-    Takes a string representing a board and returns a dictionary with keys
-    being shape card codes and values being lists of 6x6 boolean arrays with the corresponding
-    figures placed at the correct position
+    Takes a board (a string or a `Bitboard`) and returns a list of Boolean Boards,
+    one per figure in the board, with the figure placed at the correct position.
+
+    The `engine` used to find the figures is either `BITMASK` (the default),
+    which works on the color masks of the board directly, or `SKIMAGE`, which
+    labels the board with scikit-image. Both give the same results.
     '''
-    letters_to_nums = {"r": 1, "b": 2, "g": 3, "y": 4}
-    parsed_board = np.array([letters_to_nums[x] for x in board])
-    res = detect_board_figures(parsed_board)
+    if engine == BITMASK:
+        if isinstance(board, str):
+            board = Bitboard.from_string(board)
+        return [BooleanBoard.from_mask(mask, code)
+                for mask, code in detect_board_figures_bitmask(board)]
+    if engine != SKIMAGE:
+        raise ValueError(f"Unknown figure detection engine {engine}.")
+
+    res = detect_board_figures(parse_board(board))
     print(res)
     matching_6x6_matrices = []
     
@@ -153,3 +365,112 @@ def shapes_on_board(board):
         matching_6x6_matrices.append(BooleanBoard(fig, position))
         
     return matching_6x6_matrices
+
+
+class FigureCache:
+    """
+    A bounded LRU cache of figure detection results. Detection is a pure
+    function of the board, so results are stored under the board string (and
+    the engine used) and shared by every caller: they are made immutable
+    (`BoardFigures`, whose Boolean Boards have read-only matrices) before
+    being stored.
+
+    Attributes
+    ----------
+    maxsize : int
+        Maximum number of boards kept. The least recently used board is
+        evicted when a new one would exceed it.
+    hits : int
+        Number of lookups answered from the cache.
+    misses : int
+        Number of lookups which required running the detection.
+    lock : threading.Lock
+        Guards the entries and counters: the cache is used both from the event
+        loop and from sync endpoints, which run in a thread pool.
+    """
+
+    def __init__(self, maxsize: int = FIGURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries : OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def peek(self, key):
+        """Returns the result stored under `key`, or None, without counting it."""
+        with self.lock:
+            return self.entries.get(key)
+
+    def get(self, key):
+        """Returns the result stored under `key`, or None, counting the hit or miss."""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return result
+
+    def put(self, key, boolean_boards):
+        """Freezes `boolean_boards` into `BoardFigures`, stores them under `key`, and returns them."""
+        result = BoardFigures(boolean_boards)
+        with self.lock:
+            if self.maxsize <= 0:
+                return result
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def resize(self, maxsize: int):
+        """Changes the capacity of the cache, evicting boards if necessary."""
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.entries) > max(maxsize, 0):
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache and resets its counters."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+figure_cache = FigureCache()
+
+def shapes_on_board(board, engine=DEFAULT_ENGINE):
+    '''
+    Cached version of `find_shapes`: returns the `BoardFigures` of all figures in
+    `board` (a string or a `Bitboard`). Repeated calls on the
+    same board are answered by `figure_cache`; the result must not be mutated.
+    '''
+    if not isinstance(board, str):
+        board = board.to_string()
+    key = (board, engine)
+    result = figure_cache.get(key)
+    if result is None:
+        result = figure_cache.put(key, find_shapes(board, engine))
+    return result
+
+def update_shapes_after_swap(old_board, board, i, j, k, l, engine=DEFAULT_ENGINE):
+    '''
+    To be called when `board` (a `Bitboard`) is obtained by swapping the squares
+    (i, j) and (k, l) of `old_board` (a string). If the figures of `old_board`
+    are cached, those of `board` are found incrementally (see
+    `redetect_after_swap`), cached and returned. Otherwise nothing is done and
+    None is returned: the figures of `board` will be found when requested.
+    '''
+    key = (board.to_string(), engine)
+    result = figure_cache.peek(key)
+    if result is not None:
+        return result
+    previous = figure_cache.peek((old_board, engine))
+    if previous is None:
+        return None
+    return figure_cache.put(key, redetect_after_swap(previous, board, i, j, k, l))
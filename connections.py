@@ -1,13 +1,36 @@
 from typing import DefaultDict
 from collections import defaultdict
+import asyncio
 import datetime
+import time
+from collections import deque
 
 from fastapi import WebSocket
 
+from lobby import LobbySnapshot, LOBBY_SNAPSHOT, LOBBY_DIFF, LOBBY_CHANGED
+from constants import SEND_TIMEOUT, LATENCY_SAMPLES, OUTBOX_SIZE
+
 LISTING_ID = 0
 PULL_GAMES = "PULL GAMES"
 UPDATE_GAME = "UPDATE GAME"
 GAME_ENDED = "GAME_ENDED"
+# Scheduled in the listing channel to refresh and push the lobby snapshot.
+LOBBY_REFRESH = "LOBBY REFRESH"
+# What is done with a message which finds the outbox of a websocket full:
+# drop a message of its kind (the oldest one queued, or else the incoming one)...
+DROP = "drop"
+# ...or disconnect the websocket, which has fallen too far behind.
+DISCONNECT = "disconnect"
+# The default overflow policy, by message prefix: notifications which only tell
+# clients to re-fetch some state are dropped. Other messages disconnect.
+DROP_POLICY = {
+    UPDATE_GAME: DROP,
+    PULL_GAMES: DROP,
+    LOBBY_SNAPSHOT: DROP,
+    LOBBY_CHANGED: DROP,
+}
+# The lobby frames made obsolete by a newer `LOBBY_SNAPSHOT`.
+LOBBY_FRAMES = (LOBBY_SNAPSHOT, LOBBY_DIFF, LOBBY_CHANGED)
 
 
 def get_time():
@@ -15,6 +38,111 @@ def get_time():
     return now.strftime("%Y-%m-%d %H:%M:%S")
 
 
+class Frame:
+    """
+    A message to one or more websockets, built once per broadcast and shared
+    by the outboxes of all its recipients, so that the per-recipient work is
+    reduced to queueing a reference and handing the same ASGI event to the
+    server.
+
+    Attributes
+    ----------
+    text : str
+        The message.
+    event : dict
+        The ASGI `websocket.send` event carrying the message.
+    droppable : bool
+        Can the message be dropped when the outbox is full (see `DROP_POLICY`)?
+    queued : float
+        The `time.perf_counter()` at which the message was queued.
+    """
+
+    __slots__ = ("text", "event", "droppable", "queued")
+
+    def __init__(self, text : str, droppable : bool = False):
+        self.text = text
+        self.event = {"type": "websocket.send", "text": text}
+        self.droppable = droppable
+        self.queued = time.perf_counter()
+
+
+class Outbox:
+    """
+    The bounded queue of messages waiting to be sent to a websocket, drained
+    by a writer task of its own (see `ConnectionManager.run_writer`), so that
+    producers never wait for a slow client.
+
+    When the queue is full, the oldest droppable message is dropped to make
+    room (or the incoming one, if it is droppable too); if there is none, the
+    websocket has fallen too far behind and the outbox is marked as
+    overflowed, which makes the writer disconnect it. A lobby snapshot
+    replaces the lobby frames still waiting, which it makes obsolete.
+
+    Messages are put from the event loop of the writer: every producer
+    (endpoints, turn timers, game actors) runs on it.
+
+    Attributes
+    ----------
+    messages : deque[Frame]
+        The messages waiting.
+    maxsize : int
+        The maximum number of messages waiting.
+    overflowed : bool
+        Did a message not droppable find the queue full?
+    dropped : int
+        Number of messages dropped.
+    sending : bool
+        Is the writer sending a message?
+    wakeup : asyncio.Event
+        Set when there are messages to send.
+    idle : asyncio.Event
+        Set when every message put so far has been sent.
+    loop : asyncio.AbstractEventLoop
+        The event loop of the writer.
+    task : asyncio.Task | None
+        The writer task.
+    """
+
+    def __init__(self, maxsize : int):
+        self.messages : deque[Frame] = deque()
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.dropped = 0
+        self.sending = False
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.loop = asyncio.get_running_loop()
+        self.task : asyncio.Task | None = None
+
+    def put(self, frame : Frame) -> None:
+        """Queues a message, applying the overflow policy if the queue is full."""
+        if self.overflowed:
+            return
+        if frame.text.startswith(LOBBY_SNAPSHOT):
+            waiting = len(self.messages)
+            self.messages = deque(f for f in self.messages if not f.text.startswith(LOBBY_FRAMES))
+            self.dropped += waiting - len(self.messages)
+        if len(self.messages) >= self.maxsize:
+            oldest = next((k for k, f in enumerate(self.messages) if f.droppable), None)
+            if oldest is not None:
+                del self.messages[oldest]
+                self.dropped += 1
+            elif frame.droppable:
+                self.dropped += 1
+                return
+            else:
+                self.overflowed = True
+                self.messages.clear()
+        self.messages.append(frame)
+        self.idle.clear()
+        self.wakeup.set()
+
+    def pop(self) -> Frame | None:
+        """Takes the oldest message, or returns None if there are none."""
+        return self.messages.popleft() if self.messages else None
+
+
 class ConnectionManager:
     """
     This class is responsible for handling the connections of users to the
@@ -30,8 +158,10 @@ class ConnectionManager:
         A dictionary mapping IDs to WebSocket objects.
     user_state : (dict[int, str])
         A dictionary tracking the state of each user.
-    game_to_sockets : (DefaultDict[int, list[int]])
-        A mapping from a game ID to a list of socket IDs, the connection in the game. 
+    game_to_sockets : (DefaultDict[int, dict[int, None]])
+        A mapping from a game ID to the socket IDs of the connections in the game,
+        kept as the keys of a dict: an insertion-ordered set, so that membership
+        changes are O(1) and broadcasts follow the order of arrival. 
         The constant key `LISTING_ID` (0) is such that `game_to_sockets[LISTING_ID]` 
         maps to the websockets whose connection has been establish but not associated 
         with a particular game. 
@@ -40,9 +170,41 @@ class ConnectionManager:
     current_id : (int)
         An integer used to assign unique IDs to each WebSocket connection. Holds 
         the id of the websocket which connected last.
+    lobby : (LobbySnapshot)
+        The first page of the game listing, pushed to the websockets in the listing.
+    lobby_source : (Callable[[], list[dict]] | None)
+        Returns the current rows of the first page of the game listing. Without
+        it, the lobby is never refreshed.
+    broadcast_window : (float)
+        Seconds during which scheduled broadcasts are held so that identical
+        ones are sent once (see `schedule_broadcast`). If 0, they are sent
+        right away.
+    pending_broadcasts : (DefaultDict[int, dict[str, None]])
+        The broadcasts held, by channel (game ID, or `LISTING_ID`), in order.
+    broadcasts_sent : (int)
+        Number of scheduled broadcasts sent.
+    broadcasts_suppressed : (int)
+        Number of scheduled broadcasts dropped as identical to a held one.
+    send_timeout : (float)
+        Seconds a websocket is given to take a message before it is evicted.
+    broadcast_latencies : (deque[float])
+        The delivery times, in seconds, of the last `LATENCY_SAMPLES` messages:
+        from being queued until being taken by the websocket.
+    evicted : (int)
+        Number of websockets evicted because they failed to take a message or
+        fell too far behind.
+    outboxes : (dict[int, Outbox])
+        The outbound queue of each websocket, by socket ID.
+    outbox_size : (int)
+        The maximum number of messages waiting in each outbox.
+    drop_policy : (dict[str, str])
+        What is done with the messages starting with each prefix when they
+        find an outbox full: `DROP` or `DISCONNECT` (see `Outbox`). The
+        longest matching prefix applies; other messages disconnect.
     """
 
-    def __init__(self) -> list[(int, WebSocket)]:
+    def __init__(self, lobby_source=None, broadcast_window : float = 0,
+                 drop_policy : dict[str, str] | None = None) -> list[(int, WebSocket)]:
         """
         Initialization method. All attributes are set to the empty values corresponding 
         to their types.
@@ -50,9 +212,22 @@ class ConnectionManager:
 
         self.sockets_by_id : dict[int, WebSocket] = {}
         self.user_state : dict[int, str] = {}
-        self.game_to_sockets : DefaultDict[int, list[int]] = defaultdict(lambda : [])
+        self.game_to_sockets : DefaultDict[int, dict[int, None]] = defaultdict(dict)
         self.socket_to_game : DefaultDict[int, int] = defaultdict(lambda : [])
         self.current_id : int = 0
+        self.lobby = LobbySnapshot()
+        self.lobby_source = lobby_source
+        self.broadcast_window = broadcast_window
+        self.pending_broadcasts : DefaultDict[int, dict[str, None]] = defaultdict(dict)
+        self.broadcasts_sent : int = 0
+        self.broadcasts_suppressed : int = 0
+        self.flush_task : asyncio.Task | None = None
+        self.send_timeout : float = SEND_TIMEOUT
+        self.broadcast_latencies : deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.evicted : int = 0
+        self.outboxes : dict[int, Outbox] = {}
+        self.outbox_size : int = OUTBOX_SIZE
+        self.drop_policy : dict[str, str] = dict(DROP_POLICY if drop_policy is None else drop_policy)
 
 
     async def connect(self, websocket: WebSocket) -> int:
@@ -71,7 +246,10 @@ class ConnectionManager:
         await websocket.accept()
         self.current_id += 1
         self.sockets_by_id[self.current_id] = websocket
-        self.game_to_sockets[LISTING_ID].append(self.current_id)
+        self.game_to_sockets[LISTING_ID][self.current_id] = None
+        outbox = Outbox(self.outbox_size)
+        outbox.task = asyncio.create_task(self.run_writer(self.current_id, websocket, outbox))
+        self.outboxes[self.current_id] = outbox
         return self.current_id
 
     def disconnect(self, socket_id: int) -> None:
@@ -88,21 +266,41 @@ class ConnectionManager:
         """
 
         if socket_id in self.socket_to_game.keys():
-            game = self.socket_to_game[socket_id]
-            self.game_to_sockets[game].remove(socket_id)
-        if socket_id in self.game_to_sockets[LISTING_ID]:
-            self.game_to_sockets[LISTING_ID].remove(socket_id)
+            self.leave_game_sockets(socket_id, self.socket_to_game[socket_id])
+        self.game_to_sockets[LISTING_ID].pop(socket_id, None)
         # Delete the socket object and remove the key from the dictionary
         # storing all connections
         self.sockets_by_id[socket_id] = None
         del self.sockets_by_id[socket_id]
         self.socket_to_game[socket_id] = None
         del self.socket_to_game[socket_id]
+        outbox = self.outboxes.pop(socket_id, None)
+        if outbox is not None and outbox.task is not None:
+            try:
+                current = asyncio.current_task()
+            except RuntimeError:
+                current = None
+            # A writer disconnecting its own websocket finishes by itself
+            if outbox.task is not current and not outbox.loop.is_closed():
+                outbox.task.cancel()
         
+    def leave_game_sockets(self, socket_id : int, game_id : int) -> None:
+        """
+        Removes a socket from the sockets of a game, dropping the entry of the
+        game once it has no sockets left.
+        """
+        sockets = self.game_to_sockets.get(game_id)
+        if sockets is None:
+            return
+        sockets.pop(socket_id, None)
+        if not sockets and game_id != LISTING_ID:
+            del self.game_to_sockets[game_id]
+
     async def send_personal_message(self, socket_id : int, message : str) -> None:
         """ 
 
         This methods sends a personal (i.e. socket-specific) message.   
+        Like every message, it is queued in the outbox of the websocket.
 
         Parameters 
         ---------- 
@@ -113,7 +311,7 @@ class ConnectionManager:
 
         """
 
-        await self.sockets_by_id[socket_id].send_text(message)
+        self.outboxes[socket_id].put(self.frame(message))
 
     async def broadcast_in_game(self, game_id: int, message: str) -> None:
         """ 
@@ -129,9 +327,7 @@ class ConnectionManager:
 
         """
 
-        for socket_id in self.game_to_sockets[game_id]:
-            #if socket_id in self.sockets_by_id.keys():
-            await self.sockets_by_id[socket_id].send_text(message)
+        await self.fan_out(self.game_to_sockets.get(game_id, {}), message)
             
     async def broadcast_in_list(self, message : str) -> None:
         """ 
@@ -145,8 +341,177 @@ class ConnectionManager:
             The message to be sent.
         """
 
-        for socket_id in self.game_to_sockets[LISTING_ID]:
-            await self.sockets_by_id[socket_id].send_text(message)
+        await self.fan_out(self.game_to_sockets[LISTING_ID], message)
+
+    async def fan_out(self, socket_ids : list[int], message : str) -> None:
+        """
+        Queues a message in the outboxes of several websockets. Their writers
+        send it concurrently, so a slow client doesn't delay the others. The
+        message is wrapped in a single `Frame` shared by all of them.
+
+        Parameters
+        ----------
+        socket_ids : list[int]
+            The IDs of the websockets which will receive the message.
+        message : str
+            The message to be sent.
+        """
+        frame = self.frame(message)
+        outboxes = self.outboxes
+        for socket_id in list(socket_ids):
+            outbox = outboxes.get(socket_id)
+            if outbox is not None:
+                outbox.put(frame)
+
+    def frame(self, message : str) -> Frame:
+        """Wraps a message in a `Frame`, droppable as per `drop_policy`."""
+        action, longest = DISCONNECT, -1
+        for prefix, prefix_action in self.drop_policy.items():
+            if len(prefix) > longest and message.startswith(prefix):
+                action, longest = prefix_action, len(prefix)
+        return Frame(message, action == DROP)
+
+    async def run_writer(self, socket_id : int, websocket : WebSocket, outbox : Outbox) -> None:
+        """
+        Sends the messages of an outbox to its websocket, in order, until the
+        websocket is disconnected. A websocket which fails to take a message
+        within `send_timeout` seconds, or whose outbox overflowed, is evicted
+        (see `evict`).
+        """
+        try:
+            while True:
+                await outbox.wakeup.wait()
+                outbox.wakeup.clear()
+                while not outbox.overflowed:
+                    outbox.sending = True
+                    frame = outbox.pop()
+                    if frame is None:
+                        break
+                    # `send` takes the ASGI event as is: `send_text` would
+                    # build a new one for every recipient.
+                    async with asyncio.timeout(self.send_timeout):
+                        await websocket.send(frame.event)
+                    self.broadcast_latencies.append(time.perf_counter() - frame.queued)
+                outbox.sending = False
+                outbox.idle.set()
+                if outbox.overflowed:
+                    raise OverflowError(f"Outbox of websocket {socket_id} overflowed")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            outbox.sending = False
+            outbox.idle.set()
+            await self.evict(socket_id, websocket)
+
+    async def evict(self, socket_id : int, websocket : WebSocket) -> None:
+        """
+        Disconnects a websocket which failed to take a message or fell too far
+        behind, closing it if it is still open.
+        """
+        if self.sockets_by_id.get(socket_id) is websocket:
+            self.disconnect(socket_id)
+        self.evicted += 1
+        try:
+            await asyncio.wait_for(websocket.close(), self.send_timeout)
+        except Exception:
+            pass
+
+    async def drain(self, socket_ids=None) -> None:
+        """
+        Waits until every message queued so far for the given websockets (all
+        of them by default) has been sent, or the websocket evicted.
+        """
+        if socket_ids is None:
+            outboxes = list(self.outboxes.values())
+        else:
+            outboxes = [self.outboxes[s] for s in list(socket_ids) if s in self.outboxes]
+        for outbox in outboxes:
+            if not outbox.idle.is_set() and not outbox.loop.is_closed():
+                await outbox.idle.wait()
+
+    def latency_percentiles(self) -> dict[str, float]:
+        """
+        Returns the 50th, 90th and 99th percentiles of the delivery times (in
+        milliseconds) of the last messages, or an empty dict if there were none.
+        """
+        samples = sorted(self.broadcast_latencies)
+        if not samples:
+            return {}
+        return {f"p{q}": samples[min(len(samples) - 1, len(samples) * q // 100)] * 1000
+                for q in (50, 90, 99)}
+
+    async def publish_lobby(self) -> None:
+        """
+        Refreshes the lobby snapshot from `lobby_source` and pushes the change
+        to all websockets in the listing of games: that of the first page if
+        it changed, otherwise a `LOBBY CHANGED:` frame, as the change was
+        beyond it.
+        """
+        if self.lobby_source is None:
+            return
+        frame = self.lobby.update(self.lobby_source())
+        if frame is None:
+            frame = self.lobby.touch()
+        await self.broadcast_in_list(frame)
+
+    async def schedule_broadcast(self, channel : int, message : str) -> None:
+        """
+        Schedules a broadcast to a game (or to the listing of games, if
+        `channel` is `LISTING_ID`), to be sent at the end of the current
+        `broadcast_window`. A broadcast identical to one already held for the
+        same channel is dropped, so bursts of notifications are sent once.
+
+        Parameters
+        ----------
+        channel : int
+            The ID of the game, or `LISTING_ID`.
+        message : str
+            The message to be sent, or `LOBBY_REFRESH` to push the changes of
+            the lobby snapshot.
+        """
+        if self.broadcast_window <= 0:
+            await self.send_scheduled(channel, message)
+            return
+
+        pending = self.pending_broadcasts[channel]
+        if message in pending:
+            self.broadcasts_suppressed += 1
+            return
+        pending[message] = None
+
+        # A task of a closed event loop would never run: start another one.
+        task = self.flush_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            self.flush_task = asyncio.create_task(self.flush_broadcasts())
+
+    async def schedule_lobby(self) -> None:
+        """Schedules a refresh of the lobby snapshot; see `schedule_broadcast`."""
+        await self.schedule_broadcast(LISTING_ID, LOBBY_REFRESH)
+
+    async def flush_broadcasts(self) -> None:
+        """
+        Waits for `broadcast_window` seconds and sends the broadcasts held.
+        """
+        await asyncio.sleep(self.broadcast_window)
+        pending, self.pending_broadcasts = self.pending_broadcasts, defaultdict(dict)
+        for channel, messages in pending.items():
+            for message in messages:
+                await self.send_scheduled(channel, message)
+
+    async def send_scheduled(self, channel : int, message : str) -> None:
+        if message == LOBBY_REFRESH:
+            await self.publish_lobby()
+        elif channel == LISTING_ID:
+            await self.broadcast_in_list(message)
+        else:
+            await self.broadcast_in_game(channel, message)
+        self.broadcasts_sent += 1
+
+    async def send_lobby(self, socket_id : int) -> None:
+        """
+        Sends the current lobby snapshot to a websocket in the listing of games.
+        """
+        await self.send_personal_message(socket_id, self.lobby.frame)
 
     async def trigger_updates(self, game_id: int) -> None:
         """ 
@@ -159,13 +524,23 @@ class ConnectionManager:
             The game whose websockets are to be updated.
         """
 
-        for game_id in self.game_to_sockets:
-            await self.broadcast_in_game(game_id, f"{UPDATE_GAME} {get_time()}")
-        print(f"{UPDATE_GAME} {get_time()}")
+        await self.broadcast_in_game(game_id, f"{UPDATE_GAME} {get_time()}")
+
+    async def trigger_updates_all(self) -> None:
+        """
+        This methods triggers an update on the state of every websocket, in
+        all games and in the listing of games. Meant for administrative use
+        (e.g. after a server-side fix of the stored games): a single game is
+        updated with `trigger_updates`.
+        """
+
+        message = f"{UPDATE_GAME} {get_time()}"
+        for game_id in list(self.game_to_sockets):
+            await self.fan_out(self.game_to_sockets.get(game_id, {}), message)
         
     async def end_game(self, game_id : int, winner : str) -> None:
         game_ended = f"{GAME_ENDED} {winner} {get_time()}"
-        sockets_in_game = self.game_to_sockets[game_id].copy()
+        sockets_in_game = self.game_to_sockets.get(game_id, {}).copy()
         for socket_id in sockets_in_game:
             await self.send_personal_message(socket_id, game_ended)
             await self.remove_from_game(socket_id, game_id)
@@ -175,7 +550,8 @@ class ConnectionManager:
         This methods removes a game socket from a given game. This involves 
         (a) removing it from the list of websockets associated to that game,
         and (b) reintroducing it to the list of connected websockets that 
-        belong to no game.
+        belong to no game, which receives the changes of the lobby while the
+        websocket is sent the whole lobby snapshot.
 
         Parameters 
         ---------- 
@@ -184,10 +560,14 @@ class ConnectionManager:
         game_id : int 
             The ID of the game from which to remove the websocket.
         """
+        if socket_id not in self.sockets_by_id:
+            # Evicted meanwhile
+            return
         del self.socket_to_game[socket_id]
-        self.game_to_sockets[game_id].remove(socket_id)
-        self.game_to_sockets[LISTING_ID].append(socket_id) 
-        await self.broadcast_in_list(f"{PULL_GAMES} {get_time()}")
+        self.leave_game_sockets(socket_id, game_id)
+        await self.schedule_lobby()
+        self.game_to_sockets[LISTING_ID][socket_id] = None
+        await self.send_lobby(socket_id)
 
     async def add_to_game(self, socket_id: int, game_id: int) -> None:
         """ 
@@ -208,19 +588,13 @@ class ConnectionManager:
             The ID of the game from which to remove the websocket.
         """
 
-        # If this game is not in the G : Game ↦ Sockets mapping, add it as a null mapping;
-        # i.e. define G(game) = []
-        if game_id not in self.game_to_sockets.keys():
-            self.game_to_sockets[game_id] = []
-
         # Check this to avoid adding the same socket twice
         if socket_id not in self.game_to_sockets[game_id]:
-            self.game_to_sockets[game_id].append(socket_id)
+            self.game_to_sockets[game_id][socket_id] = None
             self.socket_to_game[socket_id] = game_id
-            # Remove the socket from the list of sockets that aren't in any game
-            if socket_id in self.game_to_sockets[LISTING_ID]:
-                self.game_to_sockets[LISTING_ID].remove(socket_id)
+            # Remove the socket from the sockets that aren't in any game
+            self.game_to_sockets[LISTING_ID].pop(socket_id, None)
 
-        await self.broadcast_in_list(f"{PULL_GAMES} {get_time()}") # In case a game was filled
+        await self.schedule_lobby() # In case a game was filled
         #await self.trigger_updates(game_id)
-        await self.broadcast_in_game(game_id, f"{PULL_GAMES} {get_time()}")
+        await self.schedule_broadcast(game_id, f"{PULL_GAMES} {get_time()}")
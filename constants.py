@@ -7,9 +7,18 @@ PAGE_INTERVAL = 8 # Number of games listed per page
 GAME_NAME = "game_name"
 GAME_MIN = "min_players"
 GAME_MAX = "max_players"
+GAME_PLAYER_COUNT = "player_count"
 GAMES_LIST = "games_list"
+NEXT_CURSOR = "next_after_id" # Cursor to the next page of games, None on the last page
+MAX_SEARCH_IDS = 512 # Above this many name matches, /search_games filters by name in SQL
 PRIVATE = "private"
 TURN_DURATION = 120
+FIGURE_CACHE_SIZE = 1024 # Number of boards whose figures are kept in memory
+WRITE_BEHIND_INTERVAL = 0.5 # Seconds between flushes of in-memory game changes to the database
+BROADCAST_WINDOW = 0.05 # Seconds during which identical websocket broadcasts are coalesced
+SEND_TIMEOUT = 5 # Seconds a websocket is given to take a broadcast message before it is evicted
+LATENCY_SAMPLES = 1024 # Number of message delivery times kept to compute latency percentiles
+OUTBOX_SIZE = 256 # Maximum number of messages waiting to be sent to a websocket
 # Error details
 GENERIC_SERVER_ERROR = '''The server received data with an unexpected format or failed to respond due to unknown reasons'''
 
@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import inspect
+from collections import deque
+
+
+class GameActor:
+    """
+    The mailbox of a game: commands (coroutine functions) posted to it are
+    run one at a time, in the order they were posted, by a task on the event
+    loop of the server. The task is started when a command is posted to an
+    empty mailbox and ends once the mailbox is drained, so idle games cost
+    nothing.
+
+    Attributes
+    ----------
+    game_id : int
+        The ID of the game.
+    mailbox : deque[tuple[Callable, tuple, asyncio.Future | None]]
+        The commands waiting to be run, with their arguments and the future
+        which gets their result, if anyone waits for it.
+    task : asyncio.Task | None
+        The task draining the mailbox.
+    on_idle : Callable[[GameActor], None] | None
+        Called when the mailbox has been drained.
+    """
+
+    def __init__(self, game_id : int, on_idle=None):
+        self.game_id = game_id
+        self.mailbox = deque()
+        self.task : asyncio.Task | None = None
+        self.on_idle = on_idle
+
+    def __len__(self):
+        return len(self.mailbox)
+
+    def post(self, command, *args, future : asyncio.Future | None = None) -> None:
+        """
+        Posts `command(*args)` to the mailbox. If `future` is given, it gets
+        the result (or the exception) of the command; otherwise failures are
+        printed. Must be called from the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        task = self.task
+        if task is None or task.done() or task.get_loop() is not loop:
+            # Commands left by a task of another (closed) event loop can't be
+            # answered anymore
+            self.mailbox = deque(entry for entry in self.mailbox
+                                 if entry[2] is None or entry[2].get_loop() is loop)
+            self.task = loop.create_task(self.drain())
+        self.mailbox.append((command, args, future))
+
+    async def run(self, command, *args):
+        """
+        Posts `command(*args)` to the mailbox and waits for its result. Must
+        not be called from a command of the same game, which would wait for
+        itself.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.post(command, *args, future=future)
+        return await future
+
+    async def drain(self) -> None:
+        while self.mailbox:
+            command, args, future = self.mailbox.popleft()
+            if future is not None and future.done():
+                # Whoever posted it stopped waiting (e.g. the request was cancelled)
+                continue
+            try:
+                result = await command(*args)
+            except Exception as e:
+                if future is None:
+                    print(f"Command {getattr(command, '__name__', command)} of game {self.game_id} failed: {e!r}")
+                elif not future.done():
+                    future.set_exception(e)
+                continue
+            if future is not None and not future.done():
+                future.set_result(result)
+        if self.on_idle is not None:
+            self.on_idle(self)
+
+
+class GameActors:
+    """
+    The actors of the games with pending commands, created when a command is
+    posted to a game and dropped when their mailbox is drained.
+
+    Commands of the same game run sequentially, so that e.g. the expiry of a
+    turn and a player skipping it never race; commands of different games
+    run concurrently.
+
+    Attributes
+    ----------
+    actors : dict[int, GameActor]
+        The busy actors, by game ID.
+    """
+
+    def __init__(self):
+        self.actors : dict[int, GameActor] = {}
+
+    def __contains__(self, game_id : int):
+        return game_id in self.actors
+
+    def __getitem__(self, game_id : int) -> GameActor:
+        actor = self.actors.get(game_id)
+        if actor is None:
+            actor = self.actors[game_id] = GameActor(game_id, self.drop)
+        return actor
+
+    def drop(self, actor : GameActor) -> None:
+        if self.actors.get(actor.game_id) is actor:
+            del self.actors[actor.game_id]
+
+    def post(self, game_id : int, command, *args) -> None:
+        """Posts `command(*args)` to the actor of a game, without waiting for it."""
+        self[game_id].post(command, *args)
+
+    async def run(self, game_id : int, command, *args):
+        """Runs `command(*args)` through the actor of a game and returns its result."""
+        return await self[game_id].run(command, *args)
+
+    def serialized(self, endpoint):
+        """
+        Decorator making every call of an async endpoint, which must take a
+        `game_id` argument, a command of the actor of that game.
+        """
+        signature = inspect.signature(endpoint)
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            game_id = signature.bind(*args, **kwargs).arguments["game_id"]
+            return await self.run(game_id, functools.partial(endpoint, *args, **kwargs))
+
+        return wrapper
@@ -0,0 +1,299 @@
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pony.orm import db_session, select
+
+from bitboard import Bitboard
+from board_shapes import update_shapes_after_swap
+from constants import WRITE_BEHIND_INTERVAL
+from orm import Game
+
+
+class LivePlayer:
+    """
+    In-memory snapshot of a `Player`, holding only plain Python values.
+
+    Attributes
+    ----------
+    id : int
+        The ID of the player.
+    name : str
+        The name of the player.
+    color : str
+        The color assigned to the player.
+    next : int
+        The ID of the player who follows this player in the turn order.
+    deck_types : list[str]
+        The sorted types of the figure cards in the player's deck.
+    deck_ids : list[int]
+        The sorted IDs of the figure cards in the player's deck.
+    hand_types : list[str]
+        The types of the figure cards in the player's hand.
+    hand_ids : list[int]
+        The IDs of the figure cards in the player's hand, in the order of `hand_types`.
+    hand_blocked : list[bool]
+        Is each figure card of the player's hand blocked?
+    moves : list[str]
+        The sorted types of the movement cards of the player.
+    """
+
+    def __init__(self, player):
+        self.id = player.id
+        self.name = player.name
+        self.color = player.color
+        self.next = player.next
+        self.deck_types = sorted([f.shape_type for f in player.shapes])
+        self.deck_ids = sorted([f.id for f in player.shapes])
+        hand = sorted(player.current_shapes)
+        self.hand_types = [f.shape_type for f in hand]
+        self.hand_ids = [f.id for f in hand]
+        self.hand_blocked = [f.is_blocked for f in hand]
+        self.moves = sorted([m.move_type for m in player.moves])
+
+
+class LiveGame:
+    """
+    In-memory snapshot of a `Game`, its players and their cards, holding
+    only plain Python values so that it can be read without a `db_session`.
+
+    The board is kept as a `Bitboard` and changed in memory by partial moves;
+    such changes are recorded in `dirty` and written back to the database
+    later by `GameStore.flush`.
+
+    Attributes
+    ----------
+    id, name, owner_id, is_init, min_players, max_players, current_player_id,
+    old_board, move_deck, forbidden_color :
+        Same as in `Game`.
+    board : Bitboard
+        The current board.
+    players : list[LivePlayer]
+        The players of the game, in the order of `Game.players`.
+    dirty : set[str]
+        Names of the `Game` attributes changed in memory and not yet written
+        to the database.
+    """
+
+    def __init__(self, game):
+        self.id = game.id
+        self.name = game.name
+        self.owner_id = game.owner_id
+        self.is_init = game.is_init
+        self.min_players = game.min_players
+        self.max_players = game.max_players
+        self.current_player_id = game.current_player_id
+        self.board = Bitboard.from_string(game.board)
+        self.old_board = game.old_board
+        self.move_deck = list(game.move_deck)
+        self.forbidden_color = game.forbidden_color
+        self.players = [LivePlayer(p) for p in game.players]
+        self.dirty = set()
+
+    def persisted_value(self, attr):
+        """The value of the attribute `attr` as stored in `Game`."""
+        if attr == "board":
+            return self.board.to_string()
+        return getattr(self, attr)
+
+    def exchange_blocks(self, i, j, k, l):
+        """
+        In-memory counterpart of `Game.exchange_blocks`: swaps the squares at
+        positions (i, j) and (k, l) of the board.
+
+        The swap is made on a copy of the board, which then replaces it, so
+        that readers in other threads (`/game_state`, the flusher) never see a
+        half-swapped board.
+        """
+        if any(arg > 5 for arg in [i, j, k, l]):
+            raise(ValueError("""Invalid swap coordinates: in a 6x6 board,
+                             all coordinate values must range in {0, 1, …, 5}"""))
+        if self.board.color_index(i, j) == self.board.color_index(k, l):
+            return
+        old_board = self.board.to_string()
+        board = self.board.copy()
+        board.swap(i, j, k, l)
+        self.board = board
+        update_shapes_after_swap(old_board, board, i, j, k, l)
+        self.dirty.add("board")
+
+    def undo_moves(self):
+        """
+        In-memory counterpart of `Game.undo_moves`: restores the board to the
+        last committed one.
+        """
+        self.board = Bitboard.from_string(self.old_board)
+        self.dirty.add("board")
+
+
+class GameStore:
+    """
+    Process-wide store of `LiveGame` snapshots, which serves hot reads (e.g.
+    `/game_state`) without touching the database and buffers board changes
+    made by partial moves (write-behind), flushing them in batches.
+
+    Code that changes a game through the ORM must do so inside
+    `store.mutating(game_id)`, which flushes the pending changes of the game
+    before the ORM reads it and drops its snapshot afterwards, so it is
+    reloaded with the new state on the next read.
+
+    Attributes
+    ----------
+    games : dict[int, LiveGame]
+        The snapshots held, by game ID.
+    generations : DefaultDict[int, int]
+        Number of times each game has been dropped. A snapshot loaded while the
+        game was being dropped (i.e. whose generation changed) is not kept.
+    writers : DefaultDict[int, int]
+        Number of `mutating` blocks currently open for each game.
+    game_locks : DefaultDict[int, threading.RLock]
+        Held by a flush of each game, from reading its pending changes until
+        they are committed, and by the `mutating` blocks of the game, so that
+        a flush never writes over changes committed meanwhile.
+    lock : threading.RLock
+        Guards the attributes above: sync endpoints run in a thread pool.
+    """
+
+    def __init__(self):
+        self.games : dict[int, LiveGame] = {}
+        self.generations = defaultdict(int)
+        self.writers = defaultdict(int)
+        self.game_locks = defaultdict(threading.RLock)
+        self.lock = threading.RLock()
+
+    def __contains__(self, game_id):
+        return game_id in self.games
+
+    def get(self, game_id : int) -> LiveGame | None:
+        """Returns the snapshot of a game, or None if it isn't loaded."""
+        return self.games.get(game_id)
+
+    def generation(self, game_id : int) -> int:
+        """Returns the current generation of a game; see `load`."""
+        return self.generations[game_id]
+
+    def load(self, game : Game, generation : int | None = None) -> LiveGame:
+        """
+        Takes a snapshot of `game`, which must be read inside a `db_session`,
+        and keeps it unless the game is being changed through the ORM or was
+        dropped since `generation` (as returned by `self.generation`) was read.
+        """
+        live = LiveGame(game)
+        with self.lock:
+            if generation is None:
+                generation = self.generations[game.id]
+            if self.writers.get(game.id, 0) == 0 and self.generations[game.id] == generation:
+                self.games[game.id] = live
+        return live
+
+    def discard(self, game_id : int) -> None:
+        """
+        Flushes the pending changes of a game and drops its snapshot.
+        """
+        self.flush([game_id])
+        with self.lock:
+            self.games.pop(game_id, None)
+            self.generations[game_id] += 1
+
+    def clear(self) -> None:
+        """Drops every snapshot, pending changes included."""
+        with self.lock:
+            for game_id in self.games:
+                self.generations[game_id] += 1
+            self.games.clear()
+
+    @contextmanager
+    def mutating(self, game_id : int):
+        """
+        Context manager wrapping changes to a game made through the ORM. It must
+        be entered before the `db_session` in which the changes are made, e.g.
+        `with store.mutating(game_id), db_session: ...`, so that the snapshot is
+        dropped after the changes are committed.
+        """
+        with self.lock:
+            self.writers[game_id] += 1
+            game_lock = self.game_locks[game_id]
+        with game_lock:
+            try:
+                self.flush([game_id])
+                yield
+            finally:
+                with self.lock:
+                    self.writers[game_id] -= 1
+                    if self.writers[game_id] == 0:
+                        del self.writers[game_id]
+                self.discard(game_id)
+
+    def flush(self, game_ids=None) -> int:
+        """
+        Writes the pending changes of the given games (all of them by default)
+        to the database, in a single transaction. Returns the number of games
+        written.
+
+        The changes stay pending until the transaction is committed, so that
+        they are written again by the next flush if it fails; those made
+        meanwhile (e.g. by a partial move, if this runs in another thread) stay
+        pending too.
+
+        Each game is locked until its changes are committed, so that a
+        `mutating` block of the game waits for them. When flushing all games,
+        those locked by another thread are skipped instead: they are flushed
+        by that `mutating` block, or by the next flush.
+        """
+        blocking = game_ids is not None
+        with self.lock:
+            if game_ids is None:
+                game_ids = list(self.games)
+            game_locks = {game_id: self.game_locks[game_id] for game_id in sorted(set(game_ids))}
+        held = [lock for lock in game_locks.values() if lock.acquire(blocking=blocking)]
+        try:
+            with self.lock:
+                pending = {}
+                for game_id, game_lock in game_locks.items():
+                    live = self.games.get(game_id)
+                    if game_lock in held and live is not None and live.dirty:
+                        pending[game_id] = (live, {attr: live.persisted_value(attr)
+                                                   for attr in live.dirty.copy()})
+            if not pending:
+                return 0
+
+            ids = list(pending)
+            with db_session:
+                for game in select(g for g in Game if g.id in ids):
+                    for attr, value in pending[game.id][1].items():
+                        setattr(game, attr, value)
+
+            with self.lock:
+                for live, written in pending.values():
+                    for attr, value in written.items():
+                        if live.persisted_value(attr) == value:
+                            live.dirty.discard(attr)
+            return len(pending)
+        finally:
+            for game_lock in held:
+                game_lock.release()
+
+    async def run_flusher(self, interval : float = WRITE_BEHIND_INTERVAL) -> None:
+        """
+        Flushes the pending changes of all games every `interval` seconds,
+        forever. Each flush runs in a worker thread, in a `db_session` of its
+        own, so that it never blocks the event loop nor joins the session of a
+        request suspended on it.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Write-behind flush failed: {e!r}")
+
+    def rebuild(self) -> int:
+        """
+        Crash recovery: loads a snapshot of every running game from the
+        database. Returns the number of games loaded.
+        """
+        with db_session:
+            games = select(g for g in Game if g.is_init)[:]
+            for game in games:
+                self.load(game)
+            return len(games)
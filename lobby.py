@@ -0,0 +1,80 @@
+import json
+
+from constants import GAME_ID
+
+LOBBY_SNAPSHOT = "LOBBY SNAPSHOT:"
+LOBBY_DIFF = "LOBBY DIFF:"
+LOBBY_CHANGED = "LOBBY CHANGED:"
+
+
+class LobbySnapshot:
+    """
+    The first page of the game listing, kept serialised so that lobby
+    updates are pushed to every listing websocket instead of each of them
+    re-fetching `/list_games`.
+
+    Every change of the page increments `version` and produces either the
+    whole page (a `LOBBY SNAPSHOT:` frame) or, if it is shorter, the
+    difference with the previous version (a `LOBBY DIFF:` frame) carrying the
+    rows `added`, the IDs `removed` and the rows `changed`. A diff applies on
+    top of the previous version only; a client which missed one waits for
+    the next snapshot or re-fetches `/list_games`.
+
+    A change of the listing which leaves the page as it is (e.g. a game
+    created or filled beyond it) increments `version` too, and produces a
+    `LOBBY CHANGED:` frame carrying only the version: clients showing later
+    pages or search results re-fetch them.
+
+    Attributes
+    ----------
+    version : int
+        The number of changes of the page so far.
+    rows : dict[int, dict]
+        The rows of the page, by game ID, in the order of `/list_games`.
+    frame : str
+        The `LOBBY SNAPSHOT:` frame of the current version.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.rows : dict[int, dict] = {}
+        self.frame = self.snapshot_frame()
+
+    def snapshot_frame(self) -> str:
+        return LOBBY_SNAPSHOT + json.dumps({"version": self.version,
+                                            "games": list(self.rows.values())})
+
+    def update(self, rows : list[dict]) -> str | None:
+        """
+        Replaces the page by `rows` and returns the frame to push to the
+        listing websockets, or None if the page didn't change.
+
+        Parameters
+        ----------
+        rows : list[dict]
+            The rows of the page, each with a `GAME_ID` key, as listed by
+            `/list_games`.
+        """
+        new_rows = {row[GAME_ID]: row for row in rows}
+        added = [row for game_id, row in new_rows.items() if game_id not in self.rows]
+        removed = [game_id for game_id in self.rows if game_id not in new_rows]
+        changed = [row for game_id, row in new_rows.items()
+                   if game_id in self.rows and self.rows[game_id] != row]
+        if not (added or removed or changed):
+            return None
+
+        self.version += 1
+        self.rows = new_rows
+        self.frame = self.snapshot_frame()
+        diff = LOBBY_DIFF + json.dumps({"version": self.version, "added": added,
+                                        "removed": removed, "changed": changed})
+        return diff if len(diff) < len(self.frame) else self.frame
+
+    def touch(self) -> str:
+        """
+        Records a change of the listing outside the page and returns the
+        `LOBBY CHANGED:` frame to push to the listing websockets.
+        """
+        self.version += 1
+        self.frame = self.snapshot_frame()
+        return LOBBY_CHANGED + json.dumps({"version": self.version})
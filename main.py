@@ -1,6 +1,5 @@
-import threading
-import time
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from connections import ConnectionManager
 from pony.orm import db_session, select
@@ -8,59 +7,95 @@ from connections import ConnectionManager, get_time
 from orm import Game, Player, Shape, PlayerMessage, LogMessage
 from fastapi.middleware.cors import CORSMiddleware
 from board_shapes import shapes_on_board
+from bitboard import mask_to_bits
 from constants import PLAYER_ID, GAME_ID, PAGE_INTERVAL, GAME_NAME, GAME_MIN, GAME_MAX, GAMES_LIST, STATUS, MAX_MESSAGE_LENGTH, PRIVATE
-from constants import SUCCESS, FAILURE, TURN_DURATION
+from constants import NEXT_CURSOR, MAX_SEARCH_IDS, GAME_PLAYER_COUNT, BROADCAST_WINDOW
+from constants import SUCCESS, FAILURE
 from wrappers import is_valid_figure, make_partial_moves_effective, search_is_valid, is_valid_password
+from wrappers import page_with_cursor
+from game_store import GameStore
+from turn_timers import TurnTimerService, TURN_STARTED
+from game_actors import GameActors
 import json
 from datetime import datetime
 
-class Timer(threading.Thread):
-    def __init__(self, game_id : int):
-        threading.Thread.__init__(self)
-        self.current_time = TURN_DURATION
-        self.game_id = game_id
-        self.is_running = True
-                
-    def run(self):
-        while self.is_running:
-            time.sleep(1)
-            if self.current_time == 0:
-                with db_session:
-                    game = Game.get(id=self.game_id)
-                    player = Player.get(id = game.current_player_id)            
-                    game.current_player_id = player.next
-                    game.complete_player_hands(player)
-
-                    # Send log report
-                    nextPlayer = Player.get(id=player.next)
-
-                    message = LogMessage(
-                        content = f"A {player.name} se le ha acabado el tiempo. Te toca, {nextPlayer.name}!",
-                        game = game,
-                        timestamp = datetime.now(),
-                    )
-                    
-                    broadcast_log = "LOG:" + json.dumps({
-                    "message": message.content,
-                    "time": message.timestamp.strftime('%H:%M')
-                    })
-                asyncio.run(manager.broadcast_in_game(self.game_id,f"TIMER_SKIP {get_time()}"))
-                asyncio.run(manager.broadcast_in_game(self.game_id, broadcast_log))
+async def expire_turn(game_id : int):
+    """
+    Command run by the actor of a game when the turn of its current player
+    runs out: passes the turn to the next player, restarts the timer and
+    notifies the players of the game.
+    """
+    if game_id in turn_timers:
+        # The turn changed (and the timer was restarted) since it ran out
+        return
+    with store.mutating(game_id), db_session:
+        game = Game.get(id=game_id)
+        if game is None or not game.is_init:
+            return
+        player = Player.get(id = game.current_player_id)            
+        game.current_player_id = player.next
+        game.complete_player_hands(player)
 
-                
-                
-            self.current_time = (self.current_time - 1) % (TURN_DURATION + 1) 
-            
-    def stop(self):
-        self.is_running = False
-        self.join()   
+        # Send log report
+        nextPlayer = Player.get(id=player.next)
+
+        message = LogMessage(
+            content = f"A {player.name} se le ha acabado el tiempo. Te toca, {nextPlayer.name}!",
+            game = game,
+            timestamp = datetime.now(),
+        )
         
+        broadcast_log = "LOG:" + json.dumps({
+        "message": message.content,
+        "time": message.timestamp.strftime('%H:%M')
+        })
+        await start_turn(game)
+    await manager.broadcast_in_game(game_id, f"TIMER_SKIP {get_time()}")
+    await manager.broadcast_in_game(game_id, broadcast_log)
+
                 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+    """
+    Rebuilds the game store and the turn timers from the database at startup
+    and runs the write-behind flusher of the store while the server is up. Pending changes are
+    flushed at shutdown.
+    """
+    store.rebuild()
+    resume_turn_timers()
+    manager.lobby.update(lobby_rows())
+    flusher = asyncio.create_task(store.run_flusher())
+    yield
+    flusher.cancel()
+    if turn_timers.task is not None:
+        turn_timers.task.cancel()
+    store.flush()
+
+app = FastAPI(lifespan=lifespan)
+
+def lobby_rows():
+    """
+    Returns the rows of the first page of `/list_games`, with the number of
+    players of each game, for the lobby snapshot of `manager`.
+    """
+    with db_session:
+        games = Game.select_joinable().prefetch(Game.players).limit(PAGE_INTERVAL)
+        return [{GAME_ID : game.id,
+                 GAME_NAME : game.name,
+                 GAME_MIN : game.min_players,
+                 GAME_MAX : game.max_players,
+                 GAME_PLAYER_COUNT : len(game.players)} for game in games]
+
+manager = ConnectionManager(lobby_rows, BROADCAST_WINDOW)
 
-manager = ConnectionManager()
+store = GameStore()
 
-timers : dict[int, Timer] = {}
+actors = GameActors()
+
+async def on_turn_expired(game_id : int):
+    actors.post(game_id, expire_turn, game_id)
+
+turn_timers = TurnTimerService(on_turn_expired)
 
 origins = ["*"]
 socket_id  : int
@@ -72,19 +107,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def start_turn(game : Game):
+    """
+    Starts (or restarts) the turn timer of a game, which must be read inside a
+    `db_session`, persists its deadline and pushes it to the players.
+    """
+    game.turn_deadline = turn_timers.start(game.id)
+    await manager.broadcast_in_game(game.id, f"{TURN_STARTED} {game.turn_deadline:.3f}")
+
+def resume_turn_timers():
+    """
+    Starts the turn timers of the running games with their persisted deadlines,
+    e.g. after a restart of the server. Turns that ran out while it was down
+    expire right away.
+    """
+    with db_session:
+        for game_id, deadline in select((g.id, g.turn_deadline) for g in Game
+                                        if g.is_init and g.turn_deadline is not None):
+            turn_timers.resume(game_id, deadline)
+
+async def abandon_game(game_id : int, player_id : int):
+    """
+    Command run by the actor of a game when one of its players leaves it to
+    create or join another game: removes the player, passing the turn on if
+    it was theirs, and ends the game if it is left with a single player (or
+    cancels it, if it hadn't begun and the player was its owner).
+
+    It runs in a `db_session` of its own, so it must not be awaited from
+    within another one.
+    """
+    with store.mutating(game_id), db_session:
+        game = Game.get(id=game_id)
+        p = Player.get(id=player_id)
+        if game is None or p is None or p not in game.players:
+            return
+
+        message = LogMessage(
+            content = f"{p.name} abandono la partida.",
+            game = game,
+            timestamp = datetime.now(),
+        )
+
+        broadcast_log = "LOG:" + json.dumps({
+            "message": message.content,
+            "time": message.timestamp.strftime('%H:%M')
+            })
+        await manager.broadcast_in_game(game_id, broadcast_log)
+
+        if (game.is_init):
+            previous = Player.get(next=p.id)
+            previous.next = p.next
+
+            if game.current_player_id == p.id:
+                game.current_player_id = p.next
+                await start_turn(game)
+
+        game.players.remove(p)
+        p.delete()
+
+        if (not game.is_init and game.owner_id == player_id):
+            await manager.broadcast_in_game(game_id, "GAME CANCELLED BY OWNER")
+            # unlink from the game all websockets remaining
+            sockets_in_game = manager.game_to_sockets[game_id].copy()
+
+            for s in sockets_in_game:
+                print(f"manager.game_to_sockets[{game_id}]: {manager.game_to_sockets[game_id]}  (tomo socket {s}), socket_to_game: {manager.socket_to_game[s]}")
+                await manager.remove_from_game(s, game_id)
+
+            game.cleanup()
+
+        elif (len(game.players) == 1 and game.is_init):
+        # Handle: ganador por abandono
+            for player in game.players:
+                await trigger_win_event(game, player)
+        await manager.broadcast_in_game(game_id, f"LEAVE {game_id} {player_id}")
+
 async def trigger_win_event(g : Game, p : Player):
     await manager.end_game(g.id, p.name)
-    if g.id in timers.keys():
-        timers[g.id].stop()
-        del timers[g.id]
+    turn_timers.cancel(g.id)
     g.cleanup()
 
+def live_game(game_id : int):
+    """
+    Returns the in-memory snapshot of a game, loading it from the database
+    if the store doesn't hold it. Returns None if the game doesn't exist.
+    """
+    live = store.get(game_id)
+    if live is not None:
+        return live
+    generation = store.generation(game_id)
+    with db_session:
+        game = Game.get(id=game_id)
+        if game is None:
+            return None
+        return store.load(game, generation)
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
 @app.get("/list_games")
-def list_games(page : int =1):
+def list_games(page : int =1, after_id : int | None = None):
     """
     
     This GET endpoint wraps available games into 8-element pages and 
@@ -92,19 +215,29 @@ def list_games(page : int =1):
     id. The information sent per each game is: (0) its ID, (1) its name, and
     (2) its min/max players configuration, 
 
+    Pages can be requested by number or with a cursor: the response carries
+    a `next_after_id` cursor (None on the last page) which, passed back as
+    `after_id`, returns the following page. Cursor pages cost the same no
+    matter how deep they are, and games created or deleted meanwhile don't
+    shift them.
+
     Arguments
     ----------
     page : int 
-        The page to return.
+        The page to return. Ignored if `after_id` is given.
+    after_id : int | None
+        Cursor: return the page of games following the game with this ID.
 
 
     """
     with db_session:
-        page = page # ¿?
-        begin = PAGE_INTERVAL * (page - 1)
-        end = PAGE_INTERVAL * page
-        all_games = Game.select().order_by(Game.id)
-        games = [game for game in all_games if not game.is_init and len(game.players) < game.max_players][begin:end]
+        games = Game.select_joinable()
+        if after_id is not None:
+            games = games.filter(lambda g: g.id > after_id).limit(PAGE_INTERVAL + 1)
+        else:
+            begin = PAGE_INTERVAL * max(page - 1, 0)
+            games = games.limit(PAGE_INTERVAL + 1, offset=begin)
+        games, next_cursor = page_with_cursor(list(games))
         response_data = []
         for game in games:
             game_row = {GAME_ID : game.id, 
@@ -113,11 +246,13 @@ def list_games(page : int =1):
                 GAME_MAX : game.max_players}
             response_data.append(game_row)
         return { GAMES_LIST : response_data,
+                NEXT_CURSOR : next_cursor,
                 STATUS : SUCCESS }
 
 
 @app.get("/search_games")
-def search_games(player_id : int, page : int =1, text : str ="", min : str ="", max : str =""):
+def search_games(player_id : int, page : int =1, text : str ="", min : str ="", max : str ="",
+                 after_id : int | None = None):
     """
     This GET endpoint is equivalent to list_games but it filters the games
     that include <text> in their name, ignoring the letter case
@@ -125,10 +260,16 @@ def search_games(player_id : int, page : int =1, text : str ="", min : str ="",
     - if a parameter has its default value, it is not filtered by this value
     - if they have an invalid value, it returns error
 
+    Like `list_games`, pages of matching games can be requested by number or
+    with the `next_after_id` cursor of the previous response; the games the
+    player is in are listed first in every page.
+
     Arguments
     ----------
     page : int 
-        The page to return.
+        The page to return. Ignored if `after_id` is given.
+    after_id : int | None
+        Cursor: return the page of games following the game with this ID.
     text : str
         The string to filter the games with.
     min : int
@@ -143,33 +284,45 @@ def search_games(player_id : int, page : int =1, text : str ="", min : str ="",
 
     with db_session:
         p = Player.get(id=player_id)
-        begin = PAGE_INTERVAL * (page - 1)
-        end = PAGE_INTERVAL * page
-        all_games = Game.select().order_by(Game.id)
-        games = [game for game in all_games
-            if not game.is_init and len(game.players) < game.max_players and p not in game.players
-        ]
-
-        # Filter the list of games
-        games = [game for game in games
-            if  text.lower() in game.name.lower()
-                and (min == "" or game.min_players == int(min))
-                and (max == "" or game.max_players == int(max))
-        ]
-        
         response_data = []
-        
-        for game in all_games:
-            if p in game.players:
-                response_data.append({GAME_ID : game.id, 
-                    GAME_NAME : game.name,
-                    GAME_MIN : game.min_players,
-                    GAME_MAX : game.max_players,
-                    PRIVATE : game.private,
-                    "active" : True})
-            
 
-        games = games[begin:end]
+        # A player is in a single game, which is listed as active
+        if p is not None:
+            game = p.game
+            response_data.append({GAME_ID : game.id, 
+                GAME_NAME : game.name,
+                GAME_MIN : game.min_players,
+                GAME_MAX : game.max_players,
+                PRIVATE : game.private,
+                "active" : True})
+
+        # The joinable games are filtered and paginated by a single query
+        games = Game.select_joinable()
+        if p is not None:
+            active_id = p.game.id
+            games = games.filter(lambda g: g.id != active_id)
+        if text != "":
+            ids = list(Game.ids_matching(text))
+            if len(ids) <= MAX_SEARCH_IDS:
+                # Only the games whose name matches are read
+                games = games.filter(lambda g: g.id in ids)
+            else:
+                # Matches are dense: scanning by ID finds a page of them early
+                lowered = text.lower()
+                games = games.filter(lambda g: lowered in g.name.lower())
+        if min != "":
+            min_players = int(min)
+            games = games.filter(lambda g: g.min_players == min_players)
+        if max != "":
+            max_players = int(max)
+            games = games.filter(lambda g: g.max_players == max_players)
+
+        if after_id is not None:
+            games = games.filter(lambda g: g.id > after_id).limit(PAGE_INTERVAL + 1)
+        else:
+            begin = PAGE_INTERVAL * (page - 1 if page > 1 else 0)
+            games = games.limit(PAGE_INTERVAL + 1, offset=begin)
+        games, next_cursor = page_with_cursor(list(games))
         for game in games:
             game_row = {GAME_ID : game.id, 
                 GAME_NAME : game.name,
@@ -179,6 +332,7 @@ def search_games(player_id : int, page : int =1, text : str ="", min : str ="",
                 "active" : False}
             response_data.append(game_row)
         return { GAMES_LIST : response_data,
+                NEXT_CURSOR : next_cursor,
                 STATUS : SUCCESS }
 
     
@@ -205,57 +359,21 @@ async def create_game(socket_id : int, game_name : str, player_name : str,
     (optional) max_players : int = 4
         Maximum number of players which can join the game.
     """
-    with db_session:
-
-        if not is_valid_password(password):
-            return {
-                "error": f"Invalid password {password}. Valid passwords should either be the empty string (for no password), or a password of >= 8 characters with at least one number and at least one uppercase character",
-                STATUS: FAILURE
-            }
+    if not is_valid_password(password):
+        return {
+            "error": f"Invalid password {password}. Valid passwords should either be the empty string (for no password), or a password of >= 8 characters with at least one number and at least one uppercase character",
+            STATUS: FAILURE
+        }
 
+    # The player leaves their previous games first, through their actors
+    with db_session:
         p = Player.get(name=player_name)
-        for game in Game.select(lambda game : p in game.players):
-                message = LogMessage(
-                    content = f"{p.name} abandono la partida.",
-                    game = game,
-                    timestamp = datetime.now(),
-                )
-
-                broadcast_log = "LOG:" + json.dumps({
-                    "message": message.content,
-                    "time": message.timestamp.strftime('%H:%M')
-                    })
-                await manager.broadcast_in_game(game.id, broadcast_log)
-                if (game.is_init):
-                    previous = Player.get(next=p.id)
-                    previous.next = p.next
-                
-                    if game.current_player_id == p.id:
-                        game.current_player_id = p.next
-                        timers[game.id].stop()
-                        timers[game.id] = Timer(game.id)
-                        timers[game.id].start()
-                
-                game.players.remove(p)
+        left_games = [game.id for game in Game.select(lambda game : p in game.players)]
+        player_id = p.id if p is not None else None
+    for left_game in left_games:
+        await actors.run(left_game, abandon_game, left_game, player_id)
 
-                if (not game.is_init and game.owner_id == p.id):
-                    await manager.broadcast_in_game(game.id, "GAME CANCELLED BY OWNER")
-                    # unlink from the game all websockets remaining
-                    sockets_in_game = manager.game_to_sockets[game.id].copy()
-                
-                    for s in sockets_in_game:
-                        print(f"manager.game_to_sockets[{game.id}]: {manager.game_to_sockets[game.id]}  (tomo socket {s}), socket_to_game: {manager.socket_to_game[s]}")
-                        await manager.remove_from_game(s, game.id)
-
-                    game.cleanup()
-                
-                elif (len(game.players) == 1 and game.is_init):
-                # Handle: ganador por abandono
-                    for player in game.players:
-                        await trigger_win_event(game, player)
-                await manager.broadcast_in_game(game.id, f"LEAVE {game.id} {p.id}")
-                
-                p.delete() 
+    with db_session:
         new_game = Game(name=game_name, 
                         min_players=min_players,
                         max_players=max_players,
@@ -266,7 +384,6 @@ async def create_game(socket_id : int, game_name : str, player_name : str,
         pid = new_game.create_player(player_name)
         new_game.owner_id = pid
         await manager.add_to_game(socket_id, new_game.id)
-        await manager.broadcast_in_list("GAMES LIST UPDATED")
         return {
 
             GAME_ID : new_game.id, 
@@ -343,11 +460,13 @@ async def connect(websocket: WebSocket):
     """
     socket_id = await manager.connect(websocket)
     await websocket.send_json({"socketId": socket_id})
+    await manager.send_lobby(socket_id)
     try:
         while True:
             try:
                 data = await websocket.receive_text()
-            except WebSocketDisconnect:
+            except (WebSocketDisconnect, RuntimeError):
+                # RuntimeError: the server closed it (see `ConnectionManager.evict`)
                 print(f'The connection with id {socket_id} closed! Now cleaning up associated data')
                 manager.disconnect(socket_id)
                 return
@@ -376,7 +495,7 @@ async def join_game(socket_id : int, game_id : int, player_name : str,
         A password which must match that of the game
         
     """
-    with db_session:
+    with store.mutating(game_id), db_session:
         # Retrieve the game by its ID
         game = Game.get(id=game_id)
         
@@ -385,13 +504,11 @@ async def join_game(socket_id : int, game_id : int, player_name : str,
             return {"error": "Game not found",
                     STATUS : FAILURE}
         
-        if len(game.players) +1 == game.max_players:
-            await manager.broadcast_in_list("GAMES LIST UPDATED")
-
         if len(game.password) > 0 and password != game.password:
             return {"error": "Incorrect password",
                     STATUS : FAILURE}
             
+        left_games = []
         if player_id != -1:
             p = Player.get(id=player_id)
             if p in game.players:
@@ -402,79 +519,38 @@ async def join_game(socket_id : int, game_id : int, player_name : str,
                     "player_names": [p.name for p in game.players],
                     STATUS: SUCCESS
                     })
-            else:
-                 # Check if the game has enough room for another player
-                if len(game.players) >= game.max_players:
-                    return {"error": "Game is already full",
-                            STATUS: FAILURE}
-                    
-                for x in Game.select(lambda x : p in x.players):
-                    message = LogMessage(
-                        content = f"{p.name} abandono la partida.",
-                        game = x,
-                        timestamp = datetime.now(),
-                    )
-
-                    broadcast_log = "LOG:" + json.dumps({
-                        "message": message.content,
-                        "time": message.timestamp.strftime('%H:%M')
-                        })
-                    await manager.broadcast_in_game(x.id, broadcast_log)
-                    
-                    if (x.is_init):
-                        previous = Player.get(next=p.id)
-                        previous.next = p.next
-                    
-                        if x.current_player_id == p.id:
-                            x.current_player_id = p.next
-                            timers[x.id].stop()
-                            timers[x.id] = Timer(game_id)
-                            timers[x.id].start()
-                            
-                    x.players.remove(p)
-                    p.delete()
-
-                    if (not x.is_init and x.owner_id == player_id):
-                        await manager.broadcast_in_game(x.id, "GAME CANCELLED BY OWNER")
-                        # unlink from the game all websockets remaining
-                        sockets_in_game = manager.game_to_sockets[x.id].copy()
-                    
-                        for s in sockets_in_game:
-                            print(f"manager.game_to_sockets[{x.id}]: {manager.game_to_sockets[x.id]}  (tomo socket {s}), socket_to_game: {manager.socket_to_game[s]}")
-                            await manager.remove_from_game(s, x.id)
-
-                        x.cleanup()
-                    
-                    elif ((len(x.players) == 1) and x.is_init):
-                    # Handle: ganador por abandono
-                        for p in x.players:
-                            await trigger_win_event(x, p)
-                    await manager.broadcast_in_game(x.id, "LEAVE {game_id} {player_id}")
-                    
-                
-                pid = game.create_player(player_name)
-                await manager.add_to_game(socket_id, game_id)
-                return ({
-                        "player_id": pid,
-                        "owner_id": game.owner_id,
-                        "player_names": [p.name for p in game.players],
-                        "is_init" : game.is_init,
-                        STATUS: SUCCESS
-                        })
-                
-        else:
-             # Check if the game has enough room for another player
-            if len(game.players) >= game.max_players:
-                return {"error": "Game is already full",
-                        STATUS: FAILURE}
-            pid = game.create_player(player_name)
-            await manager.add_to_game(socket_id, game_id)
-            return ({
-                    "player_id": pid,
-                    "owner_id": game.owner_id,
-                    "player_names": [p.name for p in game.players],
-                    STATUS: SUCCESS
-                    })
+            left_games = [x.id for x in Game.select(lambda x : p in x.players)]
+
+        # Check if the game has enough room for another player
+        if len(game.players) >= game.max_players:
+            return {"error": "Game is already full",
+                    STATUS: FAILURE}
+
+    # The player leaves their previous games first, through their actors
+    for left_game in left_games:
+        await actors.run(left_game, abandon_game, left_game, player_id)
+
+    with store.mutating(game_id), db_session:
+        game = Game.get(id=game_id)
+        if not game:
+            return {"error": "Game not found",
+                    STATUS : FAILURE}
+        # It may have been filled meanwhile
+        if len(game.players) >= game.max_players:
+            return {"error": "Game is already full",
+                    STATUS: FAILURE}
+
+        pid = game.create_player(player_name)
+        await manager.add_to_game(socket_id, game_id)
+        response = {
+                "player_id": pid,
+                "owner_id": game.owner_id,
+                "player_names": [p.name for p in game.players],
+                STATUS: SUCCESS
+                }
+        if player_id != -1:
+            response["is_init"] = game.is_init
+        return response
     
 @app.get("/game_state")
 def game_state(socket_id : int):
@@ -507,66 +583,59 @@ def game_state(socket_id : int):
 
     game_id = manager.socket_to_game[socket_id]
 
-    with db_session:
-        game = Game.get(id=game_id)
-        
-        if game is None:
-            return {"message": f"Game {game_id} does not exist.",
-                    STATUS : FAILURE }
-
-        f_cards, m_cards, names, colors, f_deck_ids = {}, {}, {}, {}, {}
-        f_hands, f_hand_ids, f_hand, f_hand_blocked = {}, {}, {}, {}
-        player_ids = []
-        for p in game.players:
-            player_ids.append(p.id)
-            f_cards[p.id] = sorted([f.shape_type for f in p.shapes ])
-            f_deck_ids[p.id] = sorted([f.id for f in p.shapes])
-            m_cards[p.id] = sorted([f.move_type for f in p.moves ])
-            names[p.id] = p.name
-            colors[p.id] = p.color
-
-            f_hands[p.id] = sorted(p.current_shapes)
-            f_hand_ids[p.id] = [f.id for f in f_hands[p.id]]
-            f_hand[p.id] = [f.shape_type for f in f_hands[p.id] ]
-            f_hand_blocked[p.id] = [f.is_blocked for f in f_hands[p.id] ]
-        
-        ingame_shapes = []
-        
-        for cards in f_hands.values():
-            ingame_shapes += [card.shape_type for card in cards if not card.is_blocked]
-            
-        boolean_boards = [b for b in shapes_on_board(game.board) if b.shape_code in ingame_shapes]
-        highlighted_squares = [0 for _ in range(36)]
-        
-        for b in boolean_boards:
-            flat_board = b.board.reshape(-1)
-            highlighted_squares = highlighted_squares + flat_board
-                
-        return({
-            "initialized":  game.is_init,
-            "player_ids": player_ids,
-            "current_player": game.current_player_id,
-            "player_names": names,
-            "player_colors": colors,
-            "player_f_cards": f_cards,
-            "player_f_hand": f_hand,
-            "player_f_hand_blocked": f_hand_blocked,
-            "player_f_hand_ids": f_hand_ids,
-            "player_f_deck_ids": f_deck_ids,
-            "player_m_cards": m_cards,
-            "owner_id" : game.owner_id,
-            "max_players" : game.max_players,
-            "min_players" : game.min_players,
-            "name" : game.name,
-            "actual_board" : game.board,
-            "old_board" : game.old_board,
-            "move_deck" : game.move_deck,
-            "highlighted_squares" : ''.join(str(x) for x in highlighted_squares),
-            "forbidden_color": game.forbidden_color,
-            STATUS : SUCCESS
-            })
+    game = live_game(game_id)
+
+    if game is None:
+        return {"message": f"Game {game_id} does not exist.",
+                STATUS : FAILURE }
+
+    f_cards, m_cards, names, colors, f_deck_ids = {}, {}, {}, {}, {}
+    f_hand_ids, f_hand, f_hand_blocked = {}, {}, {}
+    player_ids = []
+    ingame_shapes = set()
+    for p in game.players:
+        player_ids.append(p.id)
+        f_cards[p.id] = p.deck_types
+        f_deck_ids[p.id] = p.deck_ids
+        m_cards[p.id] = p.moves
+        names[p.id] = p.name
+        colors[p.id] = p.color
+
+        f_hand_ids[p.id] = p.hand_ids
+        f_hand[p.id] = p.hand_types
+        f_hand_blocked[p.id] = p.hand_blocked
+        ingame_shapes.update(t for t, blocked in zip(p.hand_types, p.hand_blocked) if not blocked)
+
+    # Read once: a partial move may replace it meanwhile
+    board = game.board
+    highlighted_squares = shapes_on_board(board).highlight(ingame_shapes)
+
+    return({
+        "initialized":  game.is_init,
+        "player_ids": player_ids,
+        "current_player": game.current_player_id,
+        "player_names": names,
+        "player_colors": colors,
+        "player_f_cards": f_cards,
+        "player_f_hand": f_hand,
+        "player_f_hand_blocked": f_hand_blocked,
+        "player_f_hand_ids": f_hand_ids,
+        "player_f_deck_ids": f_deck_ids,
+        "player_m_cards": m_cards,
+        "owner_id" : game.owner_id,
+        "max_players" : game.max_players,
+        "min_players" : game.min_players,
+        "name" : game.name,
+        "actual_board" : board.to_string(),
+        "old_board" : game.old_board,
+        "move_deck" : game.move_deck,
+        "highlighted_squares" : mask_to_bits(highlighted_squares),
+        "forbidden_color": game.forbidden_color,
+        STATUS : SUCCESS
+        })
             
 @app.put("/skip_turn")
+@actors.serialized
 async def skip_turn(game_id : int, player_id : int):
     """
     Let the player with `player_id` as ID skip a turn in the game 
@@ -586,7 +655,7 @@ async def skip_turn(game_id : int, player_id : int):
     player_id : int
         ID of the player.
     """
-    with db_session:
+    with store.mutating(game_id), db_session:
        # This fails if there is no game with game_id as id
 
         game = Game.get(id=game_id)
@@ -607,10 +676,7 @@ async def skip_turn(game_id : int, player_id : int):
             
         game.current_player_id = player.next
         game.complete_player_hands(player)
-        if game_id in timers.keys():
-            timers[game_id].stop()
-            timers[game_id] = Timer(game_id)
-            timers[game_id].start()
+        await start_turn(game)
         await manager.broadcast_in_game(game_id, "SKIP {game_id} {player_id}")
 
        # Send log report
@@ -635,6 +701,7 @@ async def skip_turn(game_id : int, player_id : int):
 
 
 @app.post("/partial_move")
+@actors.serialized
 async def partial_move(game_id : int, player_id : int, mov : int, a : int, b : int, x : int, y : int): 
     """
     Effects a partial move - i.e. changes the board in accordance to a played 
@@ -653,27 +720,24 @@ async def partial_move(game_id : int, player_id : int, mov : int, a : int, b : i
         Swap coordinates (a,b) and (x,y)
     """
 
-    with db_session:
-        game = Game.get(id=game_id)
-        player = Player.get(id=player_id)
-        if game is None:
-            return {"message": f"Game {game_id} does not exist.",
-                    STATUS : FAILURE}
-        if player is None:
-            return {"message": f"Game {game_id} does not exist.",
-                    STATUS : FAILURE}
-        if game.current_player_id != player_id:
-            return { "message": f"It is not the turn of player {player_id}.",
-                    STATUS: FAILURE }
-        game.exchange_blocks(a, b, x, y)
-        await manager.broadcast_in_game(game_id, "PARTIAL_MOVE {} {}".format(player_id, mov))
-        return {
-            "actual_board" : game.board, 
-            "old_board" : game.old_board,
-            STATUS: SUCCESS
-        }
+    game = live_game(game_id)
+    if game is None:
+        return {"message": f"Game {game_id} does not exist.",
+                STATUS : FAILURE}
+    if game.current_player_id != player_id:
+        return { "message": f"It is not the turn of player {player_id}.",
+                STATUS: FAILURE }
+    # The swap is applied in memory and written to the database by the store.
+    game.exchange_blocks(a, b, x, y)
+    await manager.broadcast_in_game(game_id, "PARTIAL_MOVE {} {}".format(player_id, mov))
+    return {
+        "actual_board" : game.board.to_string(),
+        "old_board" : game.old_board,
+        STATUS: SUCCESS
+    }
 
 @app.post("/undo_moves")
+@actors.serialized
 async def undo_moves(game_id : int): 
     """
     Undoes all the partial moves
@@ -684,19 +748,18 @@ async def undo_moves(game_id : int):
         ID of the game where the new checkpoint board is to be committed.
     """
 
-    with db_session:
-        game = Game.get(id=game_id)
-        if game is None:
-            return {"message": f"Game {game_id} does not exist.",
-                    STATUS : FAILURE }
+    game = live_game(game_id)
+    if game is None:
+        return {"message": f"Game {game_id} does not exist.",
+                STATUS : FAILURE }
 
-        game.undo_moves() # <-------------------
+    game.undo_moves() # <-------------------
 
-        await manager.broadcast_in_game(game_id, "PARTIAL MOVES WERE DISCARDED")
-        return {
-            "true_board" : game.board,
-            STATUS: SUCCESS
-        }
+    await manager.broadcast_in_game(game_id, "PARTIAL MOVES WERE DISCARDED")
+    return {
+        "true_board" : game.board.to_string(),
+        STATUS: SUCCESS
+    }
 
 
 @app.put("/start_game")
@@ -711,18 +774,18 @@ async def start_game(game_id : int):
     game_id : int 
         ID of the game to start.
     """
-    with db_session:
+    with store.mutating(game_id), db_session:
         game = Game.get(id=game_id)
         game.initialize()
         await manager.broadcast_in_game(game_id, "INITIALIZED")
-        await manager.broadcast_in_list(get_time())
-        timers[game_id] = Timer(game_id)
-        timers[game_id].start()
+        await manager.schedule_lobby()
+        await start_turn(game)
         return {"message" : f"Starting {game_id}",
                 STATUS: SUCCESS}
 
 
 @app.put("/block_figure") 
+@actors.serialized
 async def block_figure(game_id: int, player_id: int,
                        fig_id: int, used_movs : str,
                        x: int, y : int):
@@ -750,7 +813,7 @@ async def block_figure(game_id: int, player_id: int,
         y-coord of the board position sent by player.
     """
 
-    with db_session:
+    with store.mutating(game_id), db_session:
 
         game = Game.get(id=game_id)
         p = Player.get(id = player_id)
@@ -833,6 +896,7 @@ async def block_figure(game_id: int, player_id: int,
 
 
 @app.put("/claim_figure")
+@actors.serialized
 async def claim_figure(game_id : int, 
                           player_id : int, 
                           fig_id : int, 
@@ -864,7 +928,7 @@ async def claim_figure(game_id : int,
     y : int 
         y-coord of the board position sent by player.
     """
-    with db_session:
+    with store.mutating(game_id), db_session:
 
         game = Game.get(id=game_id)
         p = Player.get(id = player_id)
@@ -1078,15 +1142,18 @@ async def get_messages(game_id : int):
 
 @app.get("/get_current_time") 
 async def get_current_time(game_id : int):
-    with db_session:
-        game = Game.get(id=game_id)
-        print(f"INFO: {game}")
-        if game is None or not game.is_init:
-            return {"current_time" : -1}
-        
-    return {"current_time" : timers[game_id].current_time}
+    """
+    Returns the seconds left in the current turn of a game, or -1 if the game
+    isn't running. Clients should rather count down from the deadline pushed
+    in `TURN_STARTED`: this is a fallback, served from memory.
+    """
+    remaining = turn_timers.remaining(game_id)
+    return {"current_time" : remaining if remaining is not None else -1}
 
 @app.put("/relink_to_game")
 async def relink_to_game(socket_id : int, game_id : int):
     await manager.add_to_game(socket_id, game_id)
+    deadline = turn_timers.deadline(game_id)
+    if deadline is not None:
+        await manager.send_personal_message(socket_id, f"{TURN_STARTED} {deadline:.3f}")
         
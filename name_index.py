@@ -0,0 +1,132 @@
+import threading
+from collections import defaultdict
+
+# Substrings of up to this many characters are indexed.
+GRAM_SIZE = 3
+
+
+def grams(text : str, size : int = GRAM_SIZE):
+    """Returns the set of substrings of `text` of length 1 to `size`."""
+    return {text[k:k + n] for n in range(1, size + 1) for k in range(len(text) - n + 1)}
+
+
+class NameIndex:
+    """
+    In-memory n-gram index over the names of the games, used by
+    `/search_games` to find the games whose name contains a given text
+    (ignoring the letter case) without scanning the whole game table.
+
+    Every substring of up to `GRAM_SIZE` characters of a (lowercased) name is
+    mapped to the IDs of the games whose name contains it. A text that short
+    is looked up directly; a longer one is looked up by intersecting the
+    entries of its substrings of length `GRAM_SIZE`, and the few candidates
+    left are checked against their names.
+
+    It is kept up to date by the `after_insert` and `after_delete` hooks of
+    `orm.Game`, and built from the database on first use. Since those hooks
+    run before the transaction is committed, deleted games are only marked
+    as such, and removed by `purge` if the database confirms they are gone: a
+    deletion rolled back leaves them in place. (A game whose insertion, or
+    uncommitted deletion, is missed this way is left behind, which is
+    harmless: the IDs found are only used to filter the game table.)
+
+    Attributes
+    ----------
+    names : dict[int, str]
+        The lowercased name of every indexed game, by game ID.
+    postings : DefaultDict[str, set[int]]
+        The IDs of the games whose lowercased name contains each substring.
+    built : bool
+        Has the index been built from the database?
+    removed : set[int]
+        The IDs of the games deleted in transactions which may not have been
+        committed yet.
+    lock : threading.RLock
+        Guards the attributes above: `/search_games` runs in a thread pool.
+    """
+
+    def __init__(self):
+        self.names : dict[int, str] = {}
+        self.postings = defaultdict(set)
+        self.built = False
+        self.removed : set[int] = set()
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, game_id : int, name : str) -> None:
+        """Indexes the game `game_id`, replacing its previous entry if any."""
+        with self.lock:
+            self.remove(game_id)
+            name = name.lower()
+            self.names[game_id] = name
+            for gram in grams(name):
+                self.postings[gram].add(game_id)
+
+    def remove(self, game_id : int) -> None:
+        """Removes the game `game_id` from the index, if it is indexed."""
+        with self.lock:
+            self.removed.discard(game_id)
+            name = self.names.pop(game_id, None)
+            if name is None:
+                return
+            for gram in grams(name):
+                ids = self.postings[gram]
+                ids.discard(game_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def mark_removed(self, game_id : int) -> None:
+        """Marks the game `game_id` as deleted, pending a `purge`."""
+        with self.lock:
+            if game_id in self.names:
+                self.removed.add(game_id)
+
+    def purge(self, existing) -> None:
+        """
+        Removes the games marked as deleted which are not among the `existing`
+        IDs (those of the marked games still in the database), and unmarks
+        the others.
+        """
+        with self.lock:
+            for game_id in self.removed - set(existing):
+                self.remove(game_id)
+            self.removed.clear()
+
+    def rebuild(self, games) -> None:
+        """
+        Replaces the contents of the index.
+
+        Parameters
+        ----------
+        games : Iterable[tuple[int, str]]
+            The ID and name of every game.
+        """
+        with self.lock:
+            self.names.clear()
+            self.postings.clear()
+            self.removed.clear()
+            for game_id, name in games:
+                self.add(game_id, name)
+            self.built = True
+
+    def matching(self, text : str) -> set[int]:
+        """
+        Returns the IDs of the indexed games whose name contains `text`,
+        ignoring the letter case. An empty text matches every game.
+        """
+        text = text.lower()
+        with self.lock:
+            if text == "":
+                return set(self.names)
+            if len(text) <= GRAM_SIZE:
+                return set(self.postings.get(text, ()))
+
+            parts = sorted((self.postings.get(text[k:k + GRAM_SIZE], set())
+                            for k in range(len(text) - GRAM_SIZE + 1)), key=len)
+            candidates = parts[0].intersection(*parts[1:])
+            return {game_id for game_id in candidates if text in self.names[game_id]}
+
+
+game_names = NameIndex()
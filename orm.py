@@ -1,8 +1,14 @@
+import os
+import sqlite3
+from contextlib import closing
 from random import shuffle, sample
 from pony.orm import Database, PrimaryKey, Required, Set, Optional, StrArray
-from pony.orm import db_session, commit
+from pony.orm import db_session, commit, select, count
 from enum import StrEnum
 from datetime import datetime
+from bitboard import Bitboard
+from board_shapes import update_shapes_after_swap
+from name_index import game_names
 
 db = Database()
 
@@ -179,6 +185,9 @@ class Game(db.Entity):
         The password of the game 
     private : bool 
         Does the game have a password?
+    turn_deadline : Optional(float)
+        The time (in seconds since the epoch) at which the turn of the current
+        player runs out, if the game has begun.
     """
     id = PrimaryKey(int, auto=True) 
     name = Required(str)
@@ -196,6 +205,39 @@ class Game(db.Entity):
     log_messages = Set("LogMessage", reverse="game")
     password = Optional(str, default="")
     private = Optional(bool, default=False)
+    turn_deadline = Optional(float)
+
+    @staticmethod
+    def select_joinable():
+        """
+        Returns a query of the games which haven't begun and aren't full,
+        sorted by ID. Both conditions are evaluated by the database, so the
+        query can be paginated with `limit` without loading other games.
+        """
+        return select(g for g in Game
+                      if not g.is_init and count(p for p in g.players) < g.max_players
+                      ).order_by(Game.id)
+
+    @staticmethod
+    def ids_matching(text):
+        """
+        Returns the IDs of the games whose name contains `text`, ignoring the
+        letter case, looked up in the name index (which is built from the
+        database on first use). The games marked as deleted in the index are
+        checked against the database first.
+        """
+        if not game_names.built:
+            game_names.rebuild(select((g.id, g.name) for g in Game)[:])
+        elif game_names.removed:
+            removed = list(game_names.removed)
+            game_names.purge(select(g.id for g in Game if g.id in removed)[:])
+        return game_names.matching(text)
+
+    def after_insert(self):
+        game_names.add(self.id, self.name)
+
+    def after_delete(self):
+        game_names.mark_removed(self.id)
 
     @db_session
     def create_player(self, player_name):
@@ -413,6 +455,12 @@ class Game(db.Entity):
         """
         return self.board[i * 6 + j]
 
+    def get_bitboard(self):
+        """
+        Returns the current board as a `Bitboard`.
+        """
+        return Bitboard.from_string(self.board)
+
     @db_session 
     def commit_board(self):
         """
@@ -454,9 +502,12 @@ class Game(db.Entity):
             raise(ValueError("""Invalid swap coordinates: in a 6x6 board, 
                              all coordinate values must range in {0, 1, …, 5}"""))
 
-        board = list(self.board)
-        board[k * 6 + l], board[i * 6 + j] = board[i * 6 + j], board[k * 6 + l]
-        self.board = "".join(board)
+        board = self.get_bitboard()
+        if board.color_index(i, j) == board.color_index(k, l):
+            return
+        board.swap(i, j, k, l)
+        old_board, self.board = self.board, board.to_string()
+        update_shapes_after_swap(old_board, board, i, j, k, l)
         commit()
 
     @db_session        
@@ -519,5 +570,26 @@ class LogMessage(db.Entity):
 
 
 
-db.bind("sqlite", "switcher_storage.sqlite", create_db=True)
+# Columns added to the entities after their tables were first created, as
+# (table, column, SQL type): Pony creates missing tables, but not columns.
+ADDED_COLUMNS = [
+    ("Game", "turn_deadline", "REAL"),
+]
+
+def add_missing_columns(filename):
+    """
+    Adds the `ADDED_COLUMNS` missing from the existing tables of the SQLite
+    database in `filename`, so that the mapping can be generated against a
+    database created by an older version of the server.
+    """
+    with closing(sqlite3.connect(filename)) as connection, connection:
+        for table, column, sql_type in ADDED_COLUMNS:
+            columns = {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+            if columns and column not in columns:
+                connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sql_type}')
+
+DATABASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "switcher_storage.sqlite")
+
+add_missing_columns(DATABASE_FILE)
+db.bind("sqlite", DATABASE_FILE, create_db=True)
 db.generate_mapping(create_tables=True)
@@ -0,0 +1,59 @@
+import pytest
+from random import shuffle
+from bitboard import Bitboard, FULL_MASK, cell_bit, iter_cells, mask_to_bits
+from orm import DEFAULT_BOARD
+
+
+def random_board():
+    board = list(DEFAULT_BOARD)
+    shuffle(board)
+    return "".join(board)
+
+def test_string_round_trip():
+    for _ in range(100):
+        board = random_board()
+        assert Bitboard.from_string(board).to_string() == board
+
+def test_masks_partition_the_board():
+    bb = Bitboard.from_string(random_board())
+    union = 0
+    for mask in bb.masks:
+        assert union & mask == 0
+        assert bin(mask).count("1") == 9
+        union |= mask
+    assert union == FULL_MASK
+
+def test_color_lookup():
+    board = random_board()
+    bb = Bitboard.from_string(board)
+    for i in range(6):
+        for j in range(6):
+            assert bb.color_at(i, j) == board[i * 6 + j]
+            assert bb.color_mask(board[i * 6 + j]) & cell_bit(i, j)
+
+def test_swap():
+    bb = Bitboard.from_string(DEFAULT_BOARD)
+    bb.swap(0, 0, 5, 5)
+    assert str(bb) == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
+    bb.swap(1, 3, 5, 4)
+    assert str(bb) == "yrrrrrrrrybbbbbbbbgggggggggyyyyyyybr"
+    # Swapping squares of the same color is a no-op
+    bb.swap(0, 1, 0, 2)
+    assert str(bb) == "yrrrrrrrrybbbbbbbbgggggggggyyyyyyybr"
+
+def test_iter_cells():
+    assert list(iter_cells(0)) == []
+    assert list(iter_cells(cell_bit(5, 5) | cell_bit(0, 1) | 1)) == [0, 1, 35]
+
+def test_invalid_boards():
+    with pytest.raises(ValueError):
+        Bitboard.from_string(DEFAULT_BOARD[:-1])
+    with pytest.raises(ValueError):
+        Bitboard.from_string("x" + DEFAULT_BOARD[1:])
+    with pytest.raises(ValueError):
+        Bitboard.from_string(DEFAULT_BOARD).color_at(6, 0)
+
+def test_mask_to_bits():
+    assert mask_to_bits(0) == "0" * 36
+    assert mask_to_bits(FULL_MASK) == "1" * 36
+    assert mask_to_bits(cell_bit(0, 1) | cell_bit(5, 5)) == "01" + "0" * 33 + "1"
@@ -0,0 +1,190 @@
+import threading
+import pytest
+import numpy as np
+from random import choices, seed, shuffle
+from board_shapes import figures, rotate_figure, figure_key, FIGURE_TEMPLATES
+from board_shapes import shapes_on_board, find_shapes, BooleanBoard, SKIMAGE, BITMASK
+from board_shapes import BoardFigures, FigureCache, figure_cache, redetect_after_swap, update_shapes_after_swap
+from bitboard import Bitboard, mask_to_bits
+from wrappers import is_valid_figure
+from constants import STATUS, SUCCESS, FAILURE
+from orm import DEFAULT_BOARD
+
+
+def test_figure_templates_cover_all_rotations():
+    for code, figure in figures.items():
+        for rotation in rotate_figure(figure):
+            assert FIGURE_TEMPLATES[figure_key(rotation)] == code
+
+def test_figure_key_ignores_dtype():
+    figure = figures["s4"]
+    assert figure_key(np.array(figure, dtype=int)) == figure_key(np.array(figure, dtype=bool))
+    assert figure_key(np.rot90(np.array(figure))) != figure_key(np.array(figure))
+
+def test_boolean_board_shape_code():
+    b = BooleanBoard(np.rot90(np.array(figures["h10"])), (1, 2))
+    assert b.shape_code == "h10"
+    assert b.board.sum() == np.array(figures["h10"]).sum()
+    assert b.board[1][2] == 1 and b.board[2][2] == 0
+
+def square_board():
+    # A red `s2` square on the top left corner, the rest of the board is a
+    # checkerboard of blue and green so no other figure exists.
+    board = [["b" if (i + j) % 2 else "g" for j in range(6)] for i in range(6)]
+    for i, j in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        board[i][j] = "r"
+    return "".join("".join(row) for row in board)
+
+def test_shapes_on_board():
+    res = shapes_on_board(square_board())
+
+    assert [b.shape_code for b in res] == ["s2"]
+    assert res[0].board[:2, :2].all() and res[0].board.sum() == 4
+
+def random_board(weights):
+    return "".join(choices("rbgy", weights=weights, k=36))
+
+@pytest.mark.parametrize("weights", [(1, 1, 1, 1), (4, 2, 1, 1), (8, 1, 1, 1)])
+def test_engines_parity(weights):
+    seed(str(weights))
+    found = 0
+    for _ in range(500):
+        board = random_board(weights)
+        λ = find_shapes(board, engine=SKIMAGE)
+        μ = find_shapes(board, engine=BITMASK)
+        assert [b.shape_code for b in λ] == [b.shape_code for b in μ]
+        assert all(np.array_equal(b.board, c.board) for b, c in zip(λ, μ))
+        assert [b.mask for b in λ] == [b.mask for b in μ]
+        found += len(λ)
+    # Make sure the boards were not trivially empty of figures
+    assert found > 0
+
+def test_engines_parity_shuffled_boards():
+    seed(0)
+    for _ in range(500):
+        board = list(DEFAULT_BOARD)
+        shuffle(board)
+        board = "".join(board)
+        λ = find_shapes(board, engine=SKIMAGE)
+        μ = find_shapes(board, engine=BITMASK)
+        assert [(b.shape_code, b.mask) for b in λ] == [(b.shape_code, b.mask) for b in μ]
+
+def test_every_figure_found_everywhere():
+    # Place every rotation of every figure at every position of an otherwise
+    # empty (checkerboard) board and check both engines find exactly it.
+    background = [["b" if (i + j) % 2 else "g" for j in range(6)] for i in range(6)]
+    for code, figure in figures.items():
+        for rotation in rotate_figure(figure):
+            rows, cols = rotation.shape
+            for i in range(7 - rows):
+                for j in range(7 - cols):
+                    board = [row.copy() for row in background]
+                    for a, b in zip(*np.nonzero(rotation)):
+                        board[i + a][j + b] = "r"
+                    board = "".join("".join(row) for row in board)
+                    for engine in (SKIMAGE, BITMASK):
+                        res = find_shapes(board, engine=engine)
+                        assert [b.shape_code for b in res] == [code]
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        shapes_on_board(DEFAULT_BOARD, engine="magic")
+
+def test_shapes_on_board_is_cached():
+    figure_cache.clear()
+    board = square_board()
+
+    first = shapes_on_board(board)
+    assert (figure_cache.hits, figure_cache.misses) == (0, 1)
+    # Same board, given as a string or as a bitboard
+    assert shapes_on_board(board) is first
+    assert shapes_on_board(Bitboard.from_string(board)) is first
+    assert (figure_cache.hits, figure_cache.misses) == (2, 1)
+
+    # Results are immutable
+    assert isinstance(first, tuple) and len(first) == 1
+    with pytest.raises(ValueError):
+        first[0].board[0][0] = 0
+
+def test_figure_cache_eviction():
+    cache = FigureCache(maxsize=2)
+    cache.put("a", [])
+    cache.put("b", [])
+    assert cache.get("a") == ()
+    cache.put("c", [])
+    # "b" was the least recently used board
+    assert cache.get("b") is None
+    assert cache.get("a") == () and cache.get("c") == ()
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    cache.resize(1)
+    assert len(cache) == 1 and cache.get("c") == ()
+    cache.resize(0)
+    cache.put("d", [])
+    assert len(cache) == 0
+
+def test_figure_cache_threads():
+    """Lookups and evictions from several threads at once don't interfere."""
+    cache = FigureCache(maxsize=4)
+    def use(offset):
+        for i in range(5000):
+            key = (i + offset) % 8
+            if cache.get(key) is None:
+                cache.put(key, [])
+
+    threads = [threading.Thread(target=use, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 4 and cache.hits + cache.misses == 20000
+
+@pytest.mark.parametrize("weights", [(1, 1, 1, 1), (6, 2, 1, 1)])
+def test_redetect_after_swap(weights):
+    seed(str(weights))
+    for _ in range(100):
+        bb = Bitboard.from_string(random_board(weights))
+        figs = find_shapes(bb)
+        # Chain many swaps, always reusing the incremental result
+        for _ in range(20):
+            i, j, k, l = choices(range(6), k=4)
+            bb.swap(i, j, k, l)
+            figs = redetect_after_swap(figs, bb, i, j, k, l)
+            assert [(b.shape_code, b.mask) for b in figs] == \
+                   [(b.shape_code, b.mask) for b in find_shapes(bb)]
+
+def test_update_shapes_after_swap():
+    figure_cache.clear()
+    board = square_board()
+    bb = Bitboard.from_string(board)
+    bb.swap(1, 1, 1, 2)
+    # The figures of the old board are unknown: nothing to update
+    assert update_shapes_after_swap(board, bb, 1, 1, 1, 2) is None
+
+    shapes_on_board(board)
+    res = update_shapes_after_swap(board, bb, 1, 1, 1, 2)
+    # The swap broke the square
+    assert res == () and shapes_on_board(bb) is res
+    assert (figure_cache.hits, figure_cache.misses) == (1, 1)
+
+def test_board_figures_index():
+    res = shapes_on_board(square_board())
+    assert isinstance(res, BoardFigures)
+    assert set(res.masks) == {"s2"}
+    assert res.covers("s2", 1, 1)
+    assert not res.covers("s2", 2, 1)
+    assert not res.covers("h1", 0, 0)
+    assert [b.shape_code for b in res.figures_at(0, 1)] == ["s2"]
+    assert res.figures_at(5, 5) == []
+
+def test_is_valid_figure():
+    board = square_board()
+    assert is_valid_figure(board, "s2", 1, 0)[STATUS] == SUCCESS
+    assert is_valid_figure(board, "s2", 2, 0)[STATUS] == FAILURE
+    assert is_valid_figure(board, "s3", 1, 0)[STATUS] == FAILURE
+
+def test_highlight():
+    res = shapes_on_board(square_board())
+    assert mask_to_bits(res.highlight({"s2", "h1"})) == "110000110000" + "0" * 24
+    assert res.highlight({"h1"}) == 0
+    assert res.highlight(set()) == 0
@@ -1,10 +1,12 @@
 import pytest
+import numpy as np
 from fastapi.testclient import TestClient
 from unittest.mock import patch, AsyncMock
 from main import app, manager
 from orm import DEFAULT_BOARD, Color
 from constants import STATUS, SUCCESS, FAILURE
 from datetime import datetime
+from board_shapes import BoardFigures, matrix_to_mask, construct_6x6_matrix
 
 @pytest.fixture
 def client():
@@ -96,8 +98,9 @@ def test_claim_figure_success(client, mock_game, mock_player, mock_manager,
         mock_bool_board_instance = mock_bool_board.return_value
         mock_bool_board_instance.shape_code = "h1"
         mock_bool_board_instance.board = [[1, 0, 0], [1, 1, 1], [1, 0, 0]]
+        mock_bool_board_instance.mask = matrix_to_mask(construct_6x6_matrix(np.array(mock_bool_board_instance.board), (0, 0)))
         
-        mock_shapes_on_board.return_value = [mock_bool_board_instance]
+        mock_shapes_on_board.return_value = BoardFigures([mock_bool_board_instance])
 
 
         response = client.put(f"/claim_figure?game_id={mock_game_id}&player_id={mock_player_id}&fig_id={fig_id}&used_movs={movs}&x={x}&y={y}")
@@ -181,12 +184,13 @@ def test_claim_figure_not_on_board(client, mock_game, mock_player,
         mock_bool_board_instance = mock_bool_board.return_value
         mock_bool_board_instance.shape_code = "s2"
         mock_bool_board_instance.board = [[1, 0, 0], [1, 1, 1], [1, 0, 0]]
+        mock_bool_board_instance.mask = matrix_to_mask(construct_6x6_matrix(np.array(mock_bool_board_instance.board), (0, 0)))
         
         
         # Ensure side_effect returns these instances in order
 
         # Mock the shapes on board to return the matching figure at position (x, y)
-        mock_shapes_on_board.return_value = [mock_bool_board_instance]
+        mock_shapes_on_board.return_value = BoardFigures([mock_bool_board_instance])
 
 
         response = client.put(f"/claim_figure?game_id={mock_game_id}&player_id={mock_player_id}&fig_id={mock_shape_id}&used_movs=asdasd&x={x}&y={y}")
@@ -222,12 +226,13 @@ def test_claim_figure_not_at_position(client, mock_game, mock_player,
         mock_bool_board_instance = mock_bool_board.return_value
         mock_bool_board_instance.shape_code = "h1"
         mock_bool_board_instance.board = [[0, 1, 1], [1, 1, 1], [1, 1, 1]]
+        mock_bool_board_instance.mask = matrix_to_mask(construct_6x6_matrix(np.array(mock_bool_board_instance.board), (0, 0)))
         
         
         # Ensure side_effect returns these instances in order
 
         # Mock the shapes on board to return the matching figure at position (x, y)
-        mock_shapes_on_board.return_value = [mock_bool_board_instance]
+        mock_shapes_on_board.return_value = BoardFigures([mock_bool_board_instance])
 
         response = client.put(f"/claim_figure?game_id={mock_game_id}&player_id={mock_player_id}&fig_id={mock_fig_id}&used_movs=asdasdasd&x={x}&y={y}")
 
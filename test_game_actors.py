@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from game_actors import GameActors
+import main
+
+
+@pytest.fixture
+def actors():
+    return GameActors()
+
+@pytest.fixture
+def log():
+    return []
+
+@pytest.fixture
+def command(log):
+    async def command(name, delay=0):
+        log.append(f"{name} start")
+        await asyncio.sleep(delay)
+        log.append(f"{name} end")
+        return name
+    return command
+
+@pytest.mark.asyncio
+async def test_same_game_in_order(actors, command, log):
+    results = await asyncio.gather(actors.run(1, command, "a", 0.02),
+                                   actors.run(1, command, "b"),
+                                   actors.run(1, command, "c", 0.01))
+
+    assert results == ["a", "b", "c"]
+    assert log == ["a start", "a end", "b start", "b end", "c start", "c end"]
+    # Drained actors are dropped
+    assert 1 not in actors
+
+@pytest.mark.asyncio
+async def test_games_in_parallel(actors, command, log):
+    await asyncio.gather(actors.run(1, command, "a", 0.02),
+                         actors.run(2, command, "b", 0.01))
+
+    assert log == ["a start", "b start", "b end", "a end"]
+
+@pytest.mark.asyncio
+async def test_failures(actors, command, log, capsys):
+    async def fail():
+        raise ValueError("boom")
+
+    # The caller gets the exception...
+    with pytest.raises(ValueError):
+        await actors.run(1, fail)
+    # ...or it's printed if nobody waits, and the next commands still run
+    actors.post(1, fail)
+    assert await actors.run(1, command, "a") == "a"
+    assert "Command fail of game 1 failed: ValueError('boom')" in capsys.readouterr().out
+
+@pytest.mark.asyncio
+async def test_cancelled_command_is_skipped(actors, command, log):
+    first = asyncio.create_task(actors.run(1, command, "a", 0.02))
+    second = asyncio.create_task(actors.run(1, command, "b"))
+    await asyncio.sleep(0.01)
+    second.cancel()
+
+    assert await first == "a"
+    await asyncio.sleep(0)
+    assert log == ["a start", "a end"]
+
+@pytest.mark.asyncio
+async def test_serialized(actors, log):
+    @actors.serialized
+    async def endpoint(game_id : int, player_id : int):
+        log.append((game_id, player_id))
+        await asyncio.sleep(0.01)
+        return 1 in actors
+
+    assert endpoint.__name__ == "endpoint"
+    assert await endpoint(1, player_id=2) is True
+    assert await endpoint(player_id=3, game_id=4) is False
+    assert log == [(1, 2), (4, 3)]
+
+def test_new_event_loop(actors, command):
+    """The actors keep working when used from another event loop."""
+    assert asyncio.run(actors.run(1, command, "a")) == "a"
+    assert asyncio.run(actors.run(1, command, "b")) == "b"
+
+@pytest.mark.parametrize("endpoint, args", [
+    ("partial_move", dict(player_id=1, mov=1, a=0, b=0, x=0, y=1)),
+    ("undo_moves", dict()),
+    ("skip_turn", dict(player_id=1)),
+    ("block_figure", dict(player_id=1, fig_id=1, used_movs="", x=0, y=0)),
+    ("claim_figure", dict(player_id=1, fig_id=1, used_movs="", x=0, y=0)),
+])
+@pytest.mark.asyncio
+async def test_turn_endpoints_are_serialized(mocker, endpoint, args):
+    """
+    Idea of this test: the endpoints which change the turn or the board of a
+    game wait for the commands of the game posted before them.
+    """
+    live_game = mocker.patch('main.live_game', return_value=None)
+    game = mocker.patch('main.Game')
+    game.get.return_value = None
+    busy = asyncio.Event()
+    async def hold():
+        await busy.wait()
+    main.actors.post(1, hold)
+
+    call = asyncio.create_task(getattr(main, endpoint)(game_id=1, **args))
+    await asyncio.sleep(0.01)
+    assert not call.done()
+    live_game.assert_not_called()
+    game.get.assert_not_called()
+
+    busy.set()
+    await call
+    assert live_game.called or game.get.called
@@ -227,6 +227,8 @@ async def test_create_with_previous_games(mock_game_class, mock_manager, mock_pl
 
     mock_player.get.return_value = player_a
     mock_game_class.select.return_value = [game_1, game_2]
+    games = {game_1.id: game_1, game_2.id: game_2}
+    mock_game_class.get.side_effect = lambda id: games.get(id)
 
 
     game_2.create_player.return_value = 123
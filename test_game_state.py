@@ -1,7 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
-from main import app, manager  # Adjust the import as necessary
+from main import app, manager, store  # Adjust the import as necessary
 from constants import STATUS, SUCCESS, FAILURE
 from orm import DEFAULT_BOARD
 
@@ -9,6 +9,12 @@ from orm import DEFAULT_BOARD
 def client():
     return TestClient(app)
 
+@pytest.fixture(autouse=True)
+def clear_store():
+    store.clear()
+    yield
+    store.clear()
+
 @pytest.fixture
 def mock_game(mocker):
     # Create a mock for the Game model
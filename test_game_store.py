@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import pytest
+from pony.orm import db_session, select, core
+from orm import db, Game, Player, DEFAULT_BOARD
+from game_store import GameStore
+import main
+
+
+@pytest.fixture(scope='function', autouse=True)
+def setup_database():
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    yield
+
+@pytest.fixture
+def file_database(tmp_path):
+    """A database in a file, which (unlike one in memory) threads can share."""
+    db.disconnect()
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=str(tmp_path / "switcher.sqlite"), create_db=True)
+    db.generate_mapping(create_tables=True)
+    yield
+    db.disconnect()
+
+@pytest.fixture
+def store():
+    return GameStore()
+
+@pytest.fixture
+def game_id():
+    with db_session:
+        game = Game(name="Test Game")
+        game.create_player("Alice")
+        game.create_player("Bob")
+        game.initialize()
+        game.board = DEFAULT_BOARD
+        game.old_board = DEFAULT_BOARD
+        return game.id
+
+def load(store, game_id):
+    with db_session:
+        return store.load(Game[game_id])
+
+def stored_board(game_id):
+    with db_session:
+        return Game[game_id].board
+
+
+def test_load_snapshot(store, game_id):
+    live = load(store, game_id)
+
+    assert store.get(game_id) is live
+    with db_session:
+        game = Game[game_id]
+        assert live.name == game.name and live.is_init
+        assert live.current_player_id == game.current_player_id
+        assert live.board.to_string() == game.board
+        assert live.move_deck == list(game.move_deck)
+        assert sorted(p.id for p in live.players) == sorted(p.id for p in game.players)
+        for lp in live.players:
+            p = Player[lp.id]
+            assert lp.deck_types == sorted(f.shape_type for f in p.shapes)
+            assert lp.moves == sorted(m.move_type for m in p.moves)
+            assert sorted(lp.hand_ids) == sorted(f.id for f in p.current_shapes)
+            assert lp.hand_blocked == [False] * 3
+
+def test_write_behind(mocker, store, game_id):
+    live = load(store, game_id)
+    board = live.board
+    live.exchange_blocks(0, 0, 5, 5)
+
+    # The board read before the swap is left whole
+    assert live.board is not board
+    assert board.to_string() == DEFAULT_BOARD
+    # The change is only in memory until flushed
+    assert live.dirty == {"board"}
+    assert stored_board(game_id) == DEFAULT_BOARD
+
+    assert store.flush() == 1
+    assert live.dirty == set()
+    assert stored_board(game_id) == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
+    # Nothing left to write
+    assert store.flush() == 0
+
+    # A failed write leaves the change pending
+    live.undo_moves()
+    mocker.patch('game_store.select', side_effect=RuntimeError)
+    with pytest.raises(RuntimeError):
+        store.flush()
+    assert live.dirty == {"board"}
+    mocker.stopall()
+
+    # So does one made while it is being written
+    def move_meanwhile(query):
+        live.exchange_blocks(0, 0, 5, 5)
+        return select(query)
+    mocker.patch('game_store.select', side_effect=move_meanwhile)
+    assert store.flush() == 1
+    assert stored_board(game_id) == DEFAULT_BOARD
+    assert live.dirty == {"board"}
+    mocker.stopall()
+
+    live.undo_moves()
+    store.flush()
+    assert stored_board(game_id) == DEFAULT_BOARD
+
+def test_mutating(store, game_id):
+    live = load(store, game_id)
+    live.exchange_blocks(0, 0, 5, 5)
+
+    with store.mutating(game_id), db_session:
+        # Pending changes are flushed before the ORM reads the game...
+        game = Game[game_id]
+        assert game.board == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
+        game.commit_board()
+        # ...and snapshots taken while it is being changed are not kept
+        store.load(game)
+        assert store.get(game_id) is live
+
+    # The snapshot is dropped afterwards and reloaded with the new state
+    assert store.get(game_id) is None
+    assert load(store, game_id).old_board == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
+
+def test_stale_load_is_not_kept(store, game_id):
+    generation = store.generation(game_id)
+    store.discard(game_id)
+    with db_session:
+        store.load(Game[game_id], generation)
+    assert game_id not in store
+
+def test_rebuild(store, game_id):
+    with db_session:
+        Game(name="Lobby")
+    assert store.rebuild() == 1
+    assert game_id in store
+
+@pytest.mark.asyncio
+async def test_run_flusher(file_database, store, game_id):
+    live = load(store, game_id)
+    live.exchange_blocks(0, 0, 5, 5)
+
+    flusher = asyncio.create_task(store.run_flusher(interval=0.01))
+    await asyncio.sleep(0.05)
+    flusher.cancel()
+
+    assert stored_board(game_id) == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
+
+def test_flush_during_mutating(mocker, file_database, store, game_id):
+    """
+    Idea of this test: the flusher reads the board of a game and, before it
+    writes it, a partial move and a commit of the board are made. The board
+    committed must not be overwritten with the one read by the flusher.
+    """
+    live = load(store, game_id)
+    live.exchange_blocks(0, 0, 5, 5)
+    read, resume = threading.Event(), threading.Event()
+    def paused_select(query):
+        if not read.is_set():
+            read.set()
+            resume.wait(1)
+        return select(query)
+    mocker.patch('game_store.select', side_effect=paused_select)
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    read.wait(1)
+
+    live.exchange_blocks(0, 1, 2, 0)
+    board = live.board.to_string()
+    threading.Timer(0.05, resume.set).start()
+    with store.mutating(game_id), db_session:
+        Game[game_id].commit_board()
+    flusher.join()
+
+    with db_session:
+        assert Game[game_id].board == Game[game_id].old_board == board
+
+@pytest.mark.asyncio
+async def test_join_from_running_game(mocker, file_database):
+    """
+    Idea of this test: a player of a running game joins another one, passing
+    the turn on, while `/game_state` reads the game they left from another
+    thread. The snapshot read then isn't kept, so the new turn is served.
+    """
+    with db_session:
+        left = Game(name="Left")
+        for name in ("Alice", "Bob", "Carol"):
+            left.create_player(name)
+        left.initialize()
+        joined = Game(name="Joined")
+        joined.create_player("Dave")
+        left_id, joined_id, leaver = left.id, joined.id, left.current_player_id
+        leaver_name = Player[leaver].name
+
+    create_player = Game.create_player
+    def read_left_game(game, name):
+        # The player is created (and the session committed) once the player left
+        reader = threading.Thread(target=main.live_game, args=(left_id,))
+        reader.start()
+        reader.join()
+        return create_player(game, name)
+    mocker.patch.object(Game, 'create_player', read_left_game)
+    mocker.patch.object(main.manager, 'broadcast_in_game', new_callable=mocker.AsyncMock)
+    mocker.patch.object(main.manager, 'add_to_game', new_callable=mocker.AsyncMock)
+    mocker.patch.object(main.turn_timers, 'start', return_value=0.0)
+    main.store.clear()
+    abandon_game = main.abandon_game
+    sessions = []
+    async def spy(game_id, player_id):
+        # The player leaves in a session of its own
+        sessions.append(core.local.db_session)
+        await abandon_game(game_id, player_id)
+    mocker.patch.object(main, 'abandon_game', spy)
+    try:
+        await main.join_game(1, joined_id, leaver_name, player_id=leaver)
+        assert sessions == [None]
+        with db_session:
+            current = Game[left_id].current_player_id
+        assert current != leaver
+        assert main.live_game(left_id).current_player_id == current
+    finally:
+        main.store.clear()
@@ -1,23 +1,25 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock
-from main import app, manager
-from orm import DEFAULT_BOARD, Color
-from constants import STATUS, SUCCESS, FAILURE
+from main import app, expire_turn
+from turn_timers import TurnTimerService
 
 @pytest.fixture
 def client():
     return TestClient(app)
 
 @pytest.fixture
-def mock_game(mocker):
-    mock_game = mocker.patch('main.Game')
-    return mock_game
+def turn_timers(mocker):
+    """The timers of the server, with none running."""
+    return mocker.patch('main.turn_timers', TurnTimerService(expire_turn))
 
-def test_game_not_init(client, mock_game):
-    mock_game_instance = mock_game.return_value
-    mock_game.get.return_value = mock_game_instance
-    mock_game_instance.is_init = False
-    mock_game_instance.id = 1
+def test_no_timer(client, turn_timers):
+    # A game which hasn't begun (or doesn't exist) has no timer running
     response = client.get(f"/get_current_time?game_id=1")
-    assert response.json() == {"current_time": -1} 
\ No newline at end of file
+    assert response.json() == {"current_time": -1}
+
+
+def test_game_running(client, turn_timers, mocker):
+    mocker.patch.object(turn_timers, 'remaining', return_value=42)
+    response = client.get(f"/get_current_time?game_id=1")
+    assert response.json() == {"current_time": 42}
+    turn_timers.remaining.assert_called_once_with(1)
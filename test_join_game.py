@@ -201,7 +201,8 @@ def test_join_different_game(client, mock_game, mock_player, mock_log_message, m
         mock_log_message.return_value = log_msg
 
 
-        mock_game.get.return_value = game_2
+        games = {game_1.id: game_1, game_2.id: game_2}
+        mock_game.get.side_effect = lambda id: games.get(id)
         mock_game.select.return_value = [game_1]
         mock_player.get.return_value = player_a
 
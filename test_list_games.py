@@ -1,47 +1,83 @@
 import pytest
-from unittest.mock import patch
+from pony.orm import db_session, flush
+from orm import db, Game
 from main import list_games
 from constants import *
 
 
-# Mock Game class
-class MockGame:
-    def __init__(self, id, name, min_players, max_players, players, is_init):
-        self.id = id
-        self.name = name
-        self.min_players = min_players
-        self.max_players = max_players
-        self.players = players
-        self.is_init = is_init
+@pytest.fixture(scope='function', autouse=True)
+def setup_database():
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    yield
+
+def make_game(name, min_players, max_players, n_players, is_init):
+    with db_session:
+        game = Game(name=name, min_players=min_players, max_players=max_players)
+        for i in range(n_players):
+            game.create_player(f"{name} player {i}")
+        game.is_init = is_init
+        flush()
+        return game.id
 
 @pytest.fixture
-def mock_games():
+def games():
     return [
-        MockGame(1, 'Game 1', 2, 4, ['player1'], False),
-        MockGame(2, 'Game 2', 2, 4, ['player1', 'player2'], True),  # should be skipped
-        MockGame(3, 'Game 3', 3, 6, ['player1'], False),
-        MockGame(4, 'Game 4', 2, 4, [], False)
+        make_game('Game 1', 2, 4, 1, False),
+        make_game('Game 2', 2, 4, 2, True),   # should be skipped
+        make_game('Game 3', 3, 4, 1, False),
+        make_game('Game 4', 2, 4, 0, False),
+        make_game('Game 5', 2, 2, 2, False),  # full, should be skipped
     ]
 
-@patch('orm.Game.select')  
-def test_list_games(mock_select, mock_games):
+def test_list_games(games):
     """
-    Idea of this test: `list_pages` calls `Game.select` an orders 
-    the resulting list of games by id. So we mock `Game.select` with 
-    a function that returns a list of our `mock_games`.
+    Idea of this test: `list_games` returns the games which haven't begun
+    and aren't full, sorted by id.
     """
-    mock_select.return_value.order_by.return_value = mock_games
-
     response = list_games(page=1)
 
     expected = {
         GAMES_LIST: [
-            {GAME_ID: 1, GAME_NAME: 'Game 1', GAME_MIN: 2, GAME_MAX: 4},
-            {GAME_ID: 3, GAME_NAME: 'Game 3', GAME_MIN: 3, GAME_MAX: 6},
-            {GAME_ID: 4, GAME_NAME: 'Game 4', GAME_MIN: 2, GAME_MAX: 4},
+            {GAME_ID: games[0], GAME_NAME: 'Game 1', GAME_MIN: 2, GAME_MAX: 4},
+            {GAME_ID: games[2], GAME_NAME: 'Game 3', GAME_MIN: 3, GAME_MAX: 4},
+            {GAME_ID: games[3], GAME_NAME: 'Game 4', GAME_MIN: 2, GAME_MAX: 4},
         ],
+        NEXT_CURSOR: None,
         STATUS: SUCCESS
     }
 
     assert response == expected
-    mock_select.assert_called_once()
+
+def test_list_games_pages():
+    ids = [make_game(f'Game {i}', 2, 4, i % 3, i % 5 == 0) for i in range(30)]
+    listed = [g for i, g in enumerate(ids) if i % 5 != 0]
+
+    pages = [[g[GAME_ID] for g in list_games(page=p)[GAMES_LIST]] for p in range(1, 5)]
+
+    assert [len(p) for p in pages] == [PAGE_INTERVAL, PAGE_INTERVAL, PAGE_INTERVAL, 0]
+    assert sum(pages, []) == listed
+
+def test_list_games_cursor():
+    """
+    Idea of this test: walking the pages with the `next_after_id` cursor
+    returns the same games as asking for them by page number, and games
+    created meanwhile don't shift the pages already walked.
+    """
+    ids = [make_game(f'Game {i}', 2, 4, i % 3, i % 5 == 0) for i in range(30)]
+    listed = [g for i, g in enumerate(ids) if i % 5 != 0]
+
+    walked = []
+    response = list_games()
+    while True:
+        walked.append([g[GAME_ID] for g in response[GAMES_LIST]])
+        if response[NEXT_CURSOR] is None:
+            break
+        make_game('New game', 2, 4, 0, False)
+        response = list_games(after_id=response[NEXT_CURSOR])
+
+    assert walked[0] == listed[:PAGE_INTERVAL]
+    assert sum(walked, [])[:len(listed)] == listed
+    assert len(set(sum(walked, []))) == len(sum(walked, []))
+    assert [len(p) for p in walked[:-1]] == [PAGE_INTERVAL] * (len(walked) - 1)
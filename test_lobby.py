@@ -0,0 +1,100 @@
+import json
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import WebSocket
+from pony.orm import db_session
+from orm import db, Game
+from main import lobby_rows
+from connections import ConnectionManager
+from lobby import LobbySnapshot, LOBBY_SNAPSHOT, LOBBY_DIFF, LOBBY_CHANGED
+from constants import *
+
+
+def row(game_id, players=1):
+    return {GAME_ID: game_id, GAME_NAME: f"Game {game_id}", GAME_MIN: 2, GAME_MAX: 4,
+            GAME_PLAYER_COUNT: players}
+
+def parse(frame):
+    for prefix in (LOBBY_SNAPSHOT, LOBBY_DIFF, LOBBY_CHANGED):
+        if frame.startswith(prefix):
+            return prefix, json.loads(frame[len(prefix):])
+
+def test_update():
+    lobby = LobbySnapshot()
+    assert parse(lobby.frame) == (LOBBY_SNAPSHOT, {"version": 0, "games": []})
+
+    rows = [row(i) for i in range(1, 9)]
+    assert parse(lobby.update(rows)) == (LOBBY_SNAPSHOT, {"version": 1, "games": rows})
+    assert lobby.update(rows) is None
+
+    # A single change is pushed as a diff...
+    rows[2] = row(3, players=2)
+    rows.append(row(9))
+    del rows[0]
+    assert parse(lobby.update(rows)) == (LOBBY_DIFF, {"version": 2, "added": [row(9)],
+                                                      "removed": [1], "changed": [row(3, 2)]})
+    assert parse(lobby.frame) == (LOBBY_SNAPSHOT, {"version": 2, "games": rows})
+
+    # ...but a whole new page as a snapshot
+    rows = [row(i) for i in range(10, 18)]
+    assert parse(lobby.update(rows)) == (LOBBY_SNAPSHOT, {"version": 3, "games": rows})
+
+    # A change beyond the page only bumps the version
+    assert parse(lobby.touch()) == (LOBBY_CHANGED, {"version": 4})
+    assert parse(lobby.frame) == (LOBBY_SNAPSHOT, {"version": 4, "games": rows})
+
+@pytest.mark.asyncio
+async def test_publish_lobby():
+    rows = [row(i) for i in range(1, 5)]
+    manager = ConnectionManager(lambda: rows)
+    manager.lobby.update(rows)
+    listing = AsyncMock(spec=WebSocket)
+    player = AsyncMock(spec=WebSocket)
+    await manager.connect(listing)
+    player_socket = await manager.connect(player)
+
+    # The game fills up: the listing websocket gets the change, the player doesn't
+    rows = [row(1, players=2)] + rows[1:]
+    await manager.add_to_game(player_socket, 1)
+    await manager.drain()
+    prefix, diff = parse(listing.send.call_args.args[0]["text"])
+    assert prefix == LOBBY_DIFF and diff["changed"] == [row(1, players=2)]
+    assert not any(call.args[0]["text"].startswith("LOBBY") for call in player.send.call_args_list)
+
+    # Back to the listing, the player gets the whole snapshot
+    rows = rows[1:]
+    await manager.remove_from_game(player_socket, 1)
+    await manager.drain()
+    assert parse(player.send.call_args.args[0]["text"]) == (LOBBY_SNAPSHOT, {"version": 3, "games": rows})
+    assert listing.send.call_count == 2
+
+@pytest.mark.asyncio
+async def test_change_beyond_the_page():
+    """
+    Idea of this test: when a game beyond the first page is filled, the
+    listing websockets are told that the listing changed.
+    """
+    rows = [row(i) for i in range(1, 9)]
+    manager = ConnectionManager(lambda: rows)
+    manager.lobby.update(rows)
+    listing = AsyncMock(spec=WebSocket)
+    player = AsyncMock(spec=WebSocket)
+    await manager.connect(listing)
+    player_socket = await manager.connect(player)
+
+    await manager.add_to_game(player_socket, 9)
+    await manager.drain()
+    assert parse(listing.send.call_args.args[0]["text"]) == (LOBBY_CHANGED, {"version": 2})
+
+def test_lobby_rows():
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        started = Game(name="Started", is_init=True)
+        game = Game(name="Lobby", max_players=3)
+        game.create_player("Alice")
+        game.create_player("Bob")
+
+    assert lobby_rows() == [{GAME_ID: game.id, GAME_NAME: "Lobby", GAME_MIN: 2, GAME_MAX: 3,
+                             GAME_PLAYER_COUNT: 2}]
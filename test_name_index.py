@@ -0,0 +1,70 @@
+from pony.orm import db_session, flush, rollback
+from orm import db, Game
+from name_index import NameIndex, grams, game_names
+
+
+def test_grams():
+    assert grams("abcd") == {"a", "b", "c", "d", "ab", "bc", "cd", "abc", "bcd"}
+    assert grams("") == set()
+
+def test_matching():
+    index = NameIndex()
+    index.rebuild([(1, "apple"), (2, "Pineapple"), (3, "banana"), (4, "APPLICATION")])
+
+    assert index.built and len(index) == 4
+    assert index.matching("") == {1, 2, 3, 4}
+    assert index.matching("A") == {1, 2, 3, 4}
+    assert index.matching("pp") == {1, 2, 4}
+    assert index.matching("apple") == {1, 2}
+    assert index.matching("NEAPPLE") == {2}
+    assert index.matching("appx") == set()
+    # Every trigram of "ananan" is in "banana", which doesn't contain it
+    assert index.matching("ananan") == set()
+
+def test_add_and_remove():
+    index = NameIndex()
+    index.add(1, "apple")
+    index.add(1, "banana")
+    assert index.matching("app") == set()
+    assert index.matching("nan") == {1}
+
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0 and not index.postings
+
+def test_mark_removed_and_purge():
+    index = NameIndex()
+    index.rebuild([(1, "apple"), (2, "Pineapple")])
+    index.mark_removed(1)
+    index.mark_removed(2)
+    index.mark_removed(3)
+    # Marked games are still found until purged
+    assert index.removed == {1, 2} and index.matching("apple") == {1, 2}
+
+    # Game 2 is still in the database: its deletion was rolled back
+    index.purge([2])
+    assert index.matching("apple") == {2} and index.removed == set()
+
+def test_rolled_back_deletion():
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    game_names.built = False
+    with db_session:
+        game, other = Game(name="Apple"), Game(name="Pineapple")
+        flush()
+        game_id, other_id = game.id, other.id
+        assert Game.ids_matching("apple") == {game_id, other_id}
+
+    with db_session:
+        Game[game_id].delete()
+        flush()
+        rollback()
+    with db_session:
+        assert Game.ids_matching("apple") == {game_id, other_id}
+
+    with db_session:
+        Game[other_id].delete()
+    with db_session:
+        assert Game.ids_matching("apple") == {game_id}
+        assert not game_names.removed
@@ -1,7 +1,11 @@
 # conftest.py
+import sqlite3
+from contextlib import closing
 import pytest
 from pony.orm import db_session
 from orm import db, Game, Player, Shape, Move, DEFAULT_BOARD, Color, PlayerMessage, LogMessage # Import your database object and entity classes
+from orm import add_missing_columns
+from board_shapes import figure_cache, shapes_on_board, DEFAULT_ENGINE
 
 # Para referencia de qué hace esto, ver: 
 # https://stackoverflow.com/questions/57639915/pony-orm-tear-down-in-testing
@@ -212,6 +216,20 @@ def test_exchange_blocks():
     
     assert game.board == "yrrrrrrrrbbbbbbbbbgggggggggyyyyyyyyr"
 
+@db_session
+def test_exchange_blocks_updates_figure_cache():
+    game = Game(name="Test Game")
+    game.board = DEFAULT_BOARD
+    figure_cache.clear()
+    shapes_on_board(game.board)
+
+    game.exchange_blocks(1, 2, 2, 1)
+
+    # The figures of the new board were found incrementally by the swap
+    assert figure_cache.peek((game.board, DEFAULT_ENGINE)) is not None
+    shapes_on_board(game.board)
+    assert (figure_cache.hits, figure_cache.misses) == (1, 1)
+
 @db_session 
 def test_retrieve_move_cards():
 
@@ -252,3 +270,21 @@ def test_game_cleanup():
 @db_session 
 def test_create_message():
     pass
+
+def test_add_missing_columns(tmp_path):
+    """
+    Idea of this test: a database created before `Game.turn_deadline` existed
+    gets the column, and keeps its games.
+    """
+    filename = str(tmp_path / "old.sqlite")
+    with closing(sqlite3.connect(filename)) as connection, connection:
+        connection.execute('CREATE TABLE "Game" ("id" INTEGER PRIMARY KEY, "name" TEXT NOT NULL)')
+        connection.execute('INSERT INTO "Game" ("name") VALUES (\'Old game\')')
+
+    add_missing_columns(filename)
+    add_missing_columns(filename)
+
+    with closing(sqlite3.connect(filename)) as connection:
+        columns = [row[1] for row in connection.execute('PRAGMA table_info("Game")')]
+        assert columns == ["id", "name", "turn_deadline"]
+        assert connection.execute('SELECT "name", "turn_deadline" FROM "Game"').fetchall() == [("Old game", None)]
@@ -1,220 +1,167 @@
 import pytest
-from unittest.mock import patch
+from pony.orm import db_session, flush
+from orm import db, Game
 from main import search_games
 from constants import *
 
-# Mock Game class
-class MockGame:
-    def __init__(self, id, name, min_players, max_players, players, is_init, private):
-        self.id = id
-        self.name = name
-        self.min_players = min_players
-        self.max_players = max_players
-        self.players = players
-        self.is_init = is_init
-        self.private = private
+
+@pytest.fixture(scope='function', autouse=True)
+def setup_database():
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    yield
+
+def make_game(name, min_players=2, max_players=4, n_players=1, is_init=False, private=False):
+    with db_session:
+        game = Game(name=name, min_players=min_players, max_players=max_players, private=private)
+        for i in range(n_players):
+            game.create_player(f"{name} player {i}")
+        game.is_init = is_init
+        flush()
+        return game.id
+
+def row(game_id, name, min_players=2, max_players=4, private=False, active=False):
+    return {GAME_ID: game_id, GAME_NAME: name, GAME_MIN: min_players,
+            GAME_MAX: max_players, PRIVATE: private, "active": active}
 
 @pytest.fixture
-def mock_games():
+def games():
     return [
         # Should be skipped, list_games logic is preserved
-        MockGame(1, 'apple',        2, 4, [1], True, False),
-        MockGame(2, 'apple',        2, 2, [1, 2], False, True),
+        make_game('apple', is_init=True),
+        make_game('apple', 2, 2, n_players=2, private=True),
 
         # Should be skipped, appl not in banana
-        MockGame(3, 'banana',       2, 4, [2], False, True),
+        make_game('banana', private=True),
 
         # Should be skipped, it does not contemplate minimal differences in text
-        MockGame(4, 'maples',       2, 4, [2], False, True),
-        MockGame(5, 'appetizer',    2, 4, [1, 2], False, False),
-
-        MockGame(6, 'apple',        2, 4, [1], False, False),
-        MockGame(7, 'aPPle',        2, 4, [1], False, False),
-        MockGame(8, 'application',  2, 4, [1], False, False),
-        MockGame(9, 'APPLICATION',  2, 3, [1], False, True),
-        MockGame(10, 'pineapple',    2, 4, [1], False, True),
-        MockGame(11, 'pineapple',    2, 4, [2], False, False),
-        MockGame(12, 'pineapple',    3, 4, [2], False, True),
-        MockGame(13, 'pineapple',    2, 2, [2], False, False),
-        MockGame(14, 'pineapple',    2, 4, [2], False, True)
+        make_game('maples', private=True),
+        make_game('appetizer', n_players=2),
+
+        make_game('apple'),
+        make_game('aPPle'),
+        make_game('application'),
+        make_game('APPLICATION', 2, 3, private=True),
+        make_game('pineapple', private=True),
+        make_game('pineapple', 3, 4),
     ]
 
-
 @pytest.fixture
-def mock_player(mocker):
-    mock_player = mocker.patch('main.Player')
-    return mock_player
-
-@patch('orm.Game.select')  
-def test_search_games_matching_text(mock_select, mock_player, mock_games):
-
-    mock_select.return_value.order_by.return_value = mock_games
-    mock_player.get.return_value = 1
-
-
-
-    response = search_games(player_id = 1, page=1, text="appl", min="", max="")
-    print(response)
+def player(games):
+    """A player waiting in a lobby of their own, created after the other games."""
+    game_id = make_game('lobby', n_players=0)
+    with db_session:
+        return game_id, Game[game_id].create_player("Alice")
+
+def test_search_games_matching_text(games, player):
+    """
+    Idea of this test: the games the player is in come first, then the
+    joinable games whose name contains the text, ignoring the letter case.
+    """
+    lobby_id, player_id = player
+    response = search_games(player_id=player_id, page=1, text="appl", min="", max="")
 
     expected = {
-    'games_list': [
-        {
-            'game_id': 1,
-            'game_name': 'apple',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': True
-        },
-        {
-            'game_id': 2,
-            'game_name': 'apple',
-            'min_players': 2,
-            'max_players': 2,
-            'private': True,
-            'active': True
-        },
-        {
-            'game_id': 5,
-            'game_name': 'appetizer',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': True
-        },
-        {
-            'game_id': 6,
-            'game_name': 'apple',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': True
-        },
-        {
-            'game_id': 7,
-            'game_name': 'aPPle',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': True
-        },
-        {
-            'game_id': 8,
-            'game_name': 'application',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': True
-        },
-        {
-            'game_id': 9,
-            'game_name': 'APPLICATION',
-            'min_players': 2,
-            'max_players': 3,
-            'private': True,
-            'active': True
-        },
-        {
-            'game_id': 10,
-            'game_name': 'pineapple',
-            'min_players': 2,
-            'max_players': 4,
-            'private': True,
-            'active': True
-        },
-        {
-            'game_id': 11,
-            'game_name': 'pineapple',
-            'min_players': 2,
-            'max_players': 4,
-            'private': False,
-            'active': False
-        },
-        {
-            'game_id': 12,
-            'game_name': 'pineapple',
-            'min_players': 3,
-            'max_players': 4,
-            'private': True,
-            'active': False
-        },
-        {
-            'game_id': 13,
-            'game_name': 'pineapple',
-            'min_players': 2,
-            'max_players': 2,
-            'private': False,
-            'active': False
-        },
-        {
-            'game_id': 14,
-            'game_name': 'pineapple',
-            'min_players': 2,
-            'max_players': 4,
-            'private': True,
-            'active': False
-        }
-    ],
-    'response_status': 0
-}
+        GAMES_LIST: [
+            row(lobby_id, 'lobby', active=True),
+            row(games[5], 'apple'),
+            row(games[6], 'aPPle'),
+            row(games[7], 'application'),
+            row(games[8], 'APPLICATION', 2, 3, private=True),
+            row(games[9], 'pineapple', private=True),
+            row(games[10], 'pineapple', 3, 4),
+        ],
+        NEXT_CURSOR: None,
+        STATUS: SUCCESS
+    }
 
     assert response == expected
-    mock_select.assert_called_once()
 
-@patch('orm.Game.select')  
-def test_search_games_all_default_values(mock_select, mock_games):
+def test_search_games_short_text(games, player):
+    _, player_id = player
+    response = search_games(player_id=player_id, text="PP")
 
-    mock_select.return_value.order_by.return_value = mock_games
+    names = [g[GAME_NAME] for g in response[GAMES_LIST] if not g["active"]]
+    assert names == ['appetizer', 'apple', 'aPPle', 'application', 'APPLICATION',
+                     'pineapple', 'pineapple']
 
-    response = search_games(player_id = 1, page=1, text="", min="", max="")
+def test_search_games_all_default_values(games, player):
+    lobby_id, player_id = player
+    response = search_games(player_id=player_id, page=1, text="", min="", max="")
 
     expected = {
         GAMES_LIST: [
-            {'active': False, GAME_ID: 3, GAME_NAME: 'banana', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: True},
-            {'active': False, GAME_ID: 4, GAME_NAME: 'maples', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: True},
-            {'active': False, GAME_ID: 5, GAME_NAME: 'appetizer', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 6, GAME_NAME: 'apple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 7, GAME_NAME: 'aPPle', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 8, GAME_NAME: 'application', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 9, GAME_NAME: 'APPLICATION', GAME_MIN: 2, GAME_MAX: 3, PRIVATE: True},
-            {'active': False, GAME_ID: 10, GAME_NAME: 'pineapple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: True}
+            row(lobby_id, 'lobby', active=True),
+            row(games[2], 'banana', private=True),
+            row(games[3], 'maples', private=True),
+            row(games[4], 'appetizer'),
+            row(games[5], 'apple'),
+            row(games[6], 'aPPle'),
+            row(games[7], 'application'),
+            row(games[8], 'APPLICATION', 2, 3, private=True),
+            row(games[9], 'pineapple', private=True),
         ],
+        NEXT_CURSOR: games[9],
         STATUS: SUCCESS
     }
 
     assert response == expected
-    mock_select.assert_called_once()
 
-@patch('orm.Game.select')  
-def test_search_games_invalid_range(mock_select, mock_games):
+    response = search_games(player_id=player_id, after_id=games[9])
+    assert response[GAMES_LIST] == [row(lobby_id, 'lobby', active=True),
+                                    row(games[10], 'pineapple', 3, 4)]
+    assert response[NEXT_CURSOR] is None
 
-    mock_select.return_value.order_by.return_value = mock_games
-
-    response = search_games(player_id = 1, page=1, text="", min="", max="7")
+def test_search_games_invalid_range(games, player):
+    _, player_id = player
+    response = search_games(player_id=player_id, page=1, text="", min="", max="7")
 
     expected = {"error": "Invalid search",
                     STATUS: FAILURE}
 
     assert response == expected
 
-@patch('orm.Game.select')  
-def test_search_games_full_search(mock_select, mock_games):
-
-    mock_select.return_value.order_by.return_value = mock_games
-
-    response = search_games(player_id = 1, page=1, text="appl", min="2", max="4")
+def test_search_games_full_search(games, player):
+    lobby_id, player_id = player
+    response = search_games(player_id=player_id, page=1, text="appl", min="2", max="4")
 
     expected = {
         GAMES_LIST: [
-            {'active': False, GAME_ID: 6, GAME_NAME: 'apple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 7, GAME_NAME: 'aPPle', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 8, GAME_NAME: 'application', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 10, GAME_NAME: 'pineapple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: True},
-            {'active': False, GAME_ID: 11, GAME_NAME: 'pineapple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: False},
-            {'active': False, GAME_ID: 14, GAME_NAME: 'pineapple', GAME_MIN: 2, GAME_MAX: 4, PRIVATE: True}
+            row(lobby_id, 'lobby', active=True),
+            row(games[5], 'apple'),
+            row(games[6], 'aPPle'),
+            row(games[7], 'application'),
+            row(games[9], 'pineapple', private=True),
         ],
+        NEXT_CURSOR: None,
         STATUS: SUCCESS
     }
 
     assert response == expected
-    mock_select.assert_called_once()
+
+def test_search_games_after_cleanup(games, player):
+    """
+    Idea of this test: deleted games are no longer found, and new games
+    are found as soon as they are created.
+    """
+    _, player_id = player
+    with db_session:
+        Game[games[5]].cleanup()
+    new_id = make_game('Snapple')
+
+    response = search_games(player_id=player_id, text="apple")
+
+    ids = [g[GAME_ID] for g in response[GAMES_LIST] if not g["active"]]
+    assert ids == [games[6], games[9], games[10], new_id]
+
+def test_search_games_many_matches(games, player, mocker):
+    """
+    Idea of this test: when the name index matches too many games to pass
+    their IDs to the query, the name is filtered by the query itself.
+    """
+    _, player_id = player
+    expected = search_games(player_id=player_id, text="appl", min="2", max="4")
+
+    mocker.patch('main.MAX_SEARCH_IDS', 0)
+    assert search_games(player_id=player_id, text="appl", min="2", max="4") == expected
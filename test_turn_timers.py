@@ -0,0 +1,203 @@
+import asyncio
+import time
+import pytest
+from pony.orm import db_session
+from orm import db, Game
+from turn_timers import TurnTimerService, TURN_STARTED
+from constants import TURN_DURATION
+import main
+
+
+@pytest.fixture
+def expired():
+    return []
+
+@pytest.fixture
+def turn_timers(expired):
+    async def on_expire(game_id):
+        expired.append(game_id)
+    return TurnTimerService(on_expire)
+
+@pytest.fixture
+def server_timers(mocker, turn_timers):
+    """The timers of the server, fresh for the test."""
+    return mocker.patch.object(main, 'turn_timers', turn_timers)
+
+@pytest.mark.asyncio
+async def test_expiry_order(turn_timers, expired):
+    turn_timers.start(1, 0.06)
+    turn_timers.start(2, 0.02)
+    turn_timers.start(3, 0.04)
+    assert turn_timers.remaining(1) == 1 and 1 in turn_timers
+
+    await asyncio.sleep(0.1)
+
+    assert expired == [2, 3, 1]
+    assert len(turn_timers) == 0 and turn_timers.remaining(1) is None
+
+@pytest.mark.asyncio
+async def test_reset_and_cancel(turn_timers, expired):
+    turn_timers.start(1, 0.02)
+    turn_timers.start(2, 0.02)
+    # Restarting replaces the running timer, cancelling stops it
+    turn_timers.start(1, 0.08)
+    turn_timers.cancel(2)
+
+    await asyncio.sleep(0.05)
+    assert expired == []
+    await asyncio.sleep(0.06)
+    assert expired == [1]
+
+@pytest.mark.asyncio
+async def test_earlier_deadline_wakes_the_service(turn_timers, expired):
+    turn_timers.start(1, 10)
+    await asyncio.sleep(0.01)
+    turn_timers.start(2, 0.02)
+
+    await asyncio.sleep(0.05)
+    assert expired == [2]
+    turn_timers.cancel(1)
+
+@pytest.mark.asyncio
+async def test_restart_on_expiry(expired):
+    async def on_expire(game_id):
+        expired.append(game_id)
+        turn_timers.start(game_id, 0.02)
+    turn_timers = TurnTimerService(on_expire)
+
+    turn_timers.start(1, 0.02)
+    await asyncio.sleep(0.09)
+    turn_timers.cancel(1)
+
+    # One expiry per turn, every turn
+    assert 3 <= len(expired) <= 4
+
+@pytest.mark.asyncio
+async def test_resume(turn_timers, expired):
+    deadline = turn_timers.start(1, 0.05)
+    assert deadline == pytest.approx(time.time() + 0.05, abs=0.01)
+    turn_timers.cancel(1)
+
+    # As after a restart: a deadline yet to come, and one already passed
+    turn_timers.resume(1, deadline)
+    turn_timers.resume(2, time.time() - 10)
+    await asyncio.sleep(0.01)
+    assert expired == [2] and turn_timers.remaining(1) == 1
+    await asyncio.sleep(0.06)
+    assert expired == [2, 1]
+
+@pytest.mark.asyncio
+async def test_deadline(turn_timers):
+    assert turn_timers.deadline(1) is None
+    deadline = turn_timers.start(1, 30)
+    assert turn_timers.deadline(1) == pytest.approx(deadline, abs=0.01)
+    turn_timers.cancel(1)
+    assert turn_timers.deadline(1) is None
+
+def test_new_event_loop(turn_timers, expired):
+    """The service keeps working when used from another event loop."""
+    async def expire_soon():
+        turn_timers.start(1, 0.01)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(expire_soon())
+    asyncio.run(expire_soon())
+    assert expired == [1, 1]
+
+@pytest.mark.asyncio
+async def test_expire_turn(mocker, server_timers):
+    """
+    Idea of this test: when a turn runs out, the turn passes to the next
+    player, the timer is restarted and the players get the new deadline and
+    a TIMER_SKIP.
+    """
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        game = Game(name="Test Game")
+        game.create_player("Alice")
+        game.create_player("Bob")
+        game.initialize()
+        game_id, first = game.id, game.current_player_id
+    broadcast = mocker.patch.object(main.manager, 'broadcast_in_game', new_callable=mocker.AsyncMock)
+
+    await main.expire_turn(game_id)
+
+    with db_session:
+        game = Game[game_id]
+        assert game.current_player_id == game.players.select(lambda p: p.id == first).first().next
+        assert game.turn_deadline == pytest.approx(time.time() + TURN_DURATION, abs=1)
+    assert server_timers.remaining(game_id) == TURN_DURATION
+    messages = [call.args[1] for call in broadcast.call_args_list]
+    prefix, deadline = messages[0].split()
+    assert prefix == TURN_STARTED
+    assert float(deadline) == pytest.approx(server_timers.deadline(game_id), abs=0.01)
+    assert messages[1].startswith("TIMER_SKIP")
+    server_timers.cancel(game_id)
+
+@pytest.mark.asyncio
+async def test_resume_turn_timers(server_timers, expired):
+    """
+    Idea of this test: at startup, the timers of the running games are
+    started again with the deadlines persisted in the database.
+    """
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        running = Game(name="Running", is_init=True, turn_deadline=time.time() + 30)
+        timed_out = Game(name="Timed out", is_init=True, turn_deadline=time.time() - 30)
+        Game(name="Lobby")
+
+    main.resume_turn_timers()
+    await asyncio.sleep(0.01)
+
+    assert expired == [timed_out.id]
+    assert list(server_timers.deadlines) == [running.id]
+    assert server_timers.remaining(running.id) == 30
+    server_timers.cancel(running.id)
+
+@pytest.mark.asyncio
+async def test_relink_to_game(mocker, server_timers):
+    """
+    Idea of this test: a player who reconnects to a running game gets the
+    deadline of the current turn.
+    """
+    mocker.patch.object(main.manager, 'add_to_game', new_callable=mocker.AsyncMock)
+    send = mocker.patch.object(main.manager, 'send_personal_message', new_callable=mocker.AsyncMock)
+
+    await main.relink_to_game(7, 1)
+    send.assert_not_called()
+
+    deadline = server_timers.start(1)
+    await main.relink_to_game(7, 1)
+    server_timers.cancel(1)
+    socket_id, message = send.call_args.args
+    assert socket_id == 7 and message.startswith(TURN_STARTED)
+    assert float(message.split()[1]) == pytest.approx(deadline, abs=0.01)
+
+@pytest.mark.asyncio
+async def test_stale_expiry(mocker, server_timers):
+    """
+    Idea of this test: an expiry which reaches the actor of the game after
+    the turn changed (e.g. queued behind a `/skip_turn`) is ignored.
+    """
+    db.provider = db.schema = None
+    db.bind(provider='sqlite', filename=':memory:')
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        game = Game(name="Test Game")
+        game.create_player("Alice")
+        game.create_player("Bob")
+        game.initialize()
+        game_id, first = game.id, game.current_player_id
+    broadcast = mocker.patch.object(main.manager, 'broadcast_in_game', new_callable=mocker.AsyncMock)
+
+    server_timers.start(game_id)
+    await main.expire_turn(game_id)
+    server_timers.cancel(game_id)
+
+    with db_session:
+        assert Game[game_id].current_player_id == first
+    broadcast.assert_not_called()
@@ -1,7 +1,15 @@
+import asyncio
+import gc
+import time
 import pytest
 from unittest.mock import AsyncMock
 from fastapi import WebSocket
-from connections import ConnectionManager, LISTING_ID
+from connections import ConnectionManager, LISTING_ID, UPDATE_GAME, DROP, DISCONNECT
+from lobby import LOBBY_SNAPSHOT, LOBBY_DIFF, LOBBY_CHANGED
+
+def sent(websocket):
+    """The messages sent to a mock websocket, in order."""
+    return [call.args[0]["text"] for call in websocket.send.call_args_list]
 
 @pytest.fixture
 def connection_manager():
@@ -33,8 +41,9 @@ async def test_send_personal_message(connection_manager, mock_websocket):
     
     message = "Hello, user!"
     await connection_manager.send_personal_message(socket_id, message)
+    await connection_manager.drain()
     
-    mock_websocket.send_text.assert_called_once_with(message)
+    assert sent(mock_websocket) == [message]
 
 @pytest.mark.asyncio
 async def test_broadcast_in_game(connection_manager, mock_websocket):
@@ -45,8 +54,9 @@ async def test_broadcast_in_game(connection_manager, mock_websocket):
     
     message = "Game update"
     await connection_manager.broadcast_in_game(game_id, message)
+    await connection_manager.drain()
     
-    assert mock_websocket.send_text.call_count == 2
+    assert len(sent(mock_websocket)) == 2
 
 @pytest.mark.asyncio
 async def test_trigger_updates(connection_manager, mock_websocket):
@@ -56,8 +66,52 @@ async def test_trigger_updates(connection_manager, mock_websocket):
     await connection_manager.add_to_game(socket_id, game_id)
     
     await connection_manager.trigger_updates(game_id)
+    await connection_manager.drain()
     
-    assert mock_websocket.send_text.call_count == 2
+    assert len(sent(mock_websocket)) == 2
+
+@pytest.mark.asyncio
+async def test_shared_frame(connection_manager):
+    sockets = [AsyncMock(spec=WebSocket) for _ in range(3)]
+    for ws in sockets:
+        await connection_manager.add_to_game(await connection_manager.connect(ws), 1)
+
+    await connection_manager.broadcast_in_game(1, "Game update")
+    await connection_manager.drain()
+
+    # Every recipient is handed the same ASGI event
+    events = [ws.send.call_args.args[0] for ws in sockets]
+    assert events[0] == {"type": "websocket.send", "text": "Game update"}
+    assert all(event is events[0] for event in events)
+
+@pytest.mark.asyncio
+async def test_trigger_updates_scope(connection_manager):
+    """
+    Idea of this test: `trigger_updates` sends one message per socket of
+    the game and nothing to other games or to the listing, while
+    `trigger_updates_all` reaches every socket.
+    """
+    sockets = [AsyncMock(spec=WebSocket) for _ in range(6)]
+    ids = [await connection_manager.connect(ws) for ws in sockets]
+    # Three sockets in game 1, two in game 2 and one in the listing
+    for socket_id, game_id in zip(ids, [1, 1, 1, 2, 2]):
+        await connection_manager.add_to_game(socket_id, game_id)
+    await connection_manager.drain()
+    for ws in sockets:
+        ws.send.reset_mock()
+
+    await connection_manager.trigger_updates(1)
+    await connection_manager.drain()
+
+    sends = [len(sent(ws)) for ws in sockets]
+    assert sends == [1, 1, 1, 0, 0, 0]
+    assert sum(sends) == len(connection_manager.game_to_sockets[1])
+    assert all(sent(ws)[0].startswith(UPDATE_GAME) for ws in sockets[:3])
+
+    await connection_manager.trigger_updates_all()
+    await connection_manager.drain()
+
+    assert [len(sent(ws)) for ws in sockets] == [2, 2, 2, 1, 1, 1]
 
 @pytest.mark.asyncio
 async def test_end_game(connection_manager, mock_websocket):
@@ -68,6 +122,187 @@ async def test_end_game(connection_manager, mock_websocket):
     await connection_manager.add_to_game(socket_id, game_id)
     
     await connection_manager.end_game(game_id, winner)
+    await connection_manager.drain()
     
-    assert mock_websocket.send_text.call_count == 3
+    assert len(sent(mock_websocket)) == 3
+
+
+@pytest.mark.asyncio
+async def test_coalesced_broadcasts(mock_websocket):
+    connection_manager = ConnectionManager(broadcast_window=0.01)
+    socket_id = await connection_manager.connect(mock_websocket)
+    await connection_manager.add_to_game(socket_id, 1)
+
+    for _ in range(3):
+        await connection_manager.schedule_broadcast(1, "Game update")
+    await connection_manager.schedule_broadcast(1, "Other update")
+    # Nothing is sent until the window ends
+    assert sent(mock_websocket) == []
+
+    await asyncio.sleep(0.05)
+
+    assert sent(mock_websocket)[1:] == ["Game update", "Other update"]
+    # The lobby refresh and the PULL GAMES scheduled by `add_to_game` count too
+    assert connection_manager.broadcasts_sent == 4
+    assert connection_manager.broadcasts_suppressed == 2
+
+@pytest.mark.asyncio
+async def test_coalesced_lobby_refresh(mock_websocket):
+    calls = []
+    connection_manager = ConnectionManager(lambda: calls.append(1) or [], broadcast_window=0.01)
+    socket_ids = [await connection_manager.connect(AsyncMock(spec=WebSocket)) for _ in range(3)]
+    for socket_id in socket_ids:
+        await connection_manager.add_to_game(socket_id, 1)
+
+    await asyncio.sleep(0.05)
+
+    # Three joins, one lobby refresh
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_fan_out(connection_manager):
+    async def slow_send(message):
+        await asyncio.sleep(1)
+
+    connection_manager.send_timeout = 0.05
+    slow, failing, healthy = (AsyncMock(spec=WebSocket) for _ in range(3))
+    slow.send.side_effect = slow_send
+    failing.send.side_effect = RuntimeError("Connection closed")
+    ids = [await connection_manager.connect(ws) for ws in (slow, failing, healthy)]
+
+    await connection_manager.broadcast_in_list("Lobby update")
+    await asyncio.sleep(0.01)
+
+    # The slow client doesn't delay the others
+    assert sent(healthy) == ["Lobby update"]
+
+    await connection_manager.drain()
+    # Sockets which timed out or failed are evicted, the others kept
+    assert list(connection_manager.game_to_sockets[LISTING_ID]) == [ids[2]]
+    assert ids[0] not in connection_manager.sockets_by_id and ids[1] not in connection_manager.sockets_by_id
+    assert connection_manager.evicted == 2
+    slow.close.assert_called_once()
+
+    await connection_manager.broadcast_in_list("Lobby update")
+    await connection_manager.drain()
+    percentiles = connection_manager.latency_percentiles()
+    assert set(percentiles) == {"p50", "p90", "p99"}
+    assert percentiles["p50"] <= percentiles["p99"]
+
+@pytest.mark.asyncio
+async def test_outbox_overflow(connection_manager, mock_websocket):
+    """
+    Idea of this test: a websocket which doesn't take its messages keeps
+    only the newest notifications, and is disconnected once its outbox is
+    full of messages which can't be dropped.
+    """
+    blocked = asyncio.Event()
+    async def blocked_send(message):
+        await blocked.wait()
+
+    connection_manager.outbox_size = 3
+    mock_websocket.send.side_effect = blocked_send
+    socket_id = await connection_manager.connect(mock_websocket)
+    outbox = connection_manager.outboxes[socket_id]
+
+    # The first message is taken by the writer, which then waits for the client
+    await connection_manager.send_personal_message(socket_id, "first")
+    await asyncio.sleep(0.01)
+    for k in range(5):
+        await connection_manager.send_personal_message(socket_id, f"{UPDATE_GAME} {k}")
+    await connection_manager.send_personal_message(socket_id, "NEW CHAT MSG: hi")
+
+    assert [f.text for f in outbox.messages] == [f"{UPDATE_GAME} 3", f"{UPDATE_GAME} 4", "NEW CHAT MSG: hi"]
+    assert outbox.dropped == 3
+
+    for k in range(3):
+        await connection_manager.send_personal_message(socket_id, f"NEW CHAT MSG: {k}")
+    assert outbox.overflowed
+
+    blocked.set()
+    await asyncio.sleep(0.01)
+    assert socket_id not in connection_manager.sockets_by_id
+    mock_websocket.close.assert_called_once()
+
+def test_drop_policy(connection_manager):
+    # Notifications to re-fetch some state can be dropped, lobby diffs can't
+    for message in (f"{UPDATE_GAME} 1", f"{LOBBY_SNAPSHOT}{{}}", f"{LOBBY_CHANGED}{{}}"):
+        assert connection_manager.frame(message).droppable
+    for message in (f"{LOBBY_DIFF}{{}}", "NEW CHAT MSG: hi"):
+        assert not connection_manager.frame(message).droppable
+
+    # The longest matching prefix applies
+    manager = ConnectionManager(drop_policy={"NEW CHAT MSG": DROP, "NEW CHAT MSG: !": DISCONNECT})
+    assert manager.frame("NEW CHAT MSG: hi").droppable
+    assert not manager.frame("NEW CHAT MSG: !hi").droppable
+    assert not manager.frame(f"{UPDATE_GAME} 1").droppable
+
+@pytest.mark.asyncio
+async def test_snapshot_replaces_lobby_frames(connection_manager, mock_websocket):
+    blocked = asyncio.Event()
+    async def blocked_send(message):
+        await blocked.wait()
+
+    mock_websocket.send.side_effect = blocked_send
+    socket_id = await connection_manager.connect(mock_websocket)
+    outbox = connection_manager.outboxes[socket_id]
+    await connection_manager.send_personal_message(socket_id, "first")
+    await asyncio.sleep(0.01)
+
+    for message in (f"{LOBBY_DIFF}1", f"{UPDATE_GAME} 1", f"{LOBBY_CHANGED}2", f"{LOBBY_SNAPSHOT}3"):
+        await connection_manager.broadcast_in_list(message)
+    assert [f.text for f in outbox.messages] == [f"{UPDATE_GAME} 1", f"{LOBBY_SNAPSHOT}3"]
+    assert outbox.dropped == 2
+    blocked.set()
+
+class FakeWebSocket:
+    """A websocket which takes every message, cheaper to create than a mock."""
+    async def accept(self):
+        pass
+    async def send(self, message):
+        pass
+    async def close(self):
+        pass
+
+@pytest.mark.asyncio
+async def test_membership_stress(connection_manager):
+    """
+    Idea of this test: connecting, moving and disconnecting sockets costs
+    the same with 50k connections as with a few, i.e. it doesn't scan the
+    sockets of the listing or of a game.
+    """
+    n, chunk = 50_000, 5_000
+    connect_times, disconnect_times = [], []
+    ids = []
+    # Garbage collections of the growing heap would add noise to the timings
+    gc.disable()
+    try:
+        for start in range(0, n, chunk):
+            t = time.perf_counter()
+            for _ in range(chunk):
+                ids.append(await connection_manager.connect(FakeWebSocket()))
+            connect_times.append(time.perf_counter() - t)
+
+        # Move a batch of sockets into games and back, in the middle of the crowd
+        for socket_id in ids[n // 2:n // 2 + 100]:
+            await connection_manager.add_to_game(socket_id, socket_id % 10 + 1)
+        for socket_id in ids[n // 2:n // 2 + 100]:
+            await connection_manager.remove_from_game(socket_id, socket_id % 10 + 1)
+        assert len(connection_manager.game_to_sockets[LISTING_ID]) == n
+        assert set(connection_manager.game_to_sockets) == {LISTING_ID}
+
+        # Disconnect in order of arrival: with a list, the worst case for `remove`
+        for start in range(0, n, chunk):
+            t = time.perf_counter()
+            for socket_id in ids[start:start + chunk]:
+                connection_manager.disconnect(socket_id)
+            disconnect_times.append(time.perf_counter() - t)
+    finally:
+        gc.enable()
+    await asyncio.sleep(0)
 
+    assert not connection_manager.game_to_sockets[LISTING_ID]
+    assert not connection_manager.sockets_by_id and not connection_manager.outboxes
+    # The last chunks are not slower than the first ones (generous bound for noisy machines)
+    assert sorted(connect_times[-3:])[1] < 5 * sorted(connect_times[:3])[1] + 0.05
+    assert sorted(disconnect_times[:3])[1] < 5 * sorted(disconnect_times[-3:])[1] + 0.05
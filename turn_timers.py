@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import math
+import time
+
+from constants import TURN_DURATION
+
+# Pushed to the players of a game when a turn starts (or to a player who
+# reconnects), followed by its deadline in seconds since the epoch, so that
+# clients can render the countdown without polling.
+TURN_STARTED = "TURN_STARTED"
+
+
+class TurnTimerService:
+    """
+    Keeps the turn deadlines of all running games in a single heap, served
+    by one task on the event loop of the server, which calls `on_expire`
+    when the turn of a game runs out.
+
+    Starting (or resetting) the timer of a game pushes a new deadline in
+    O(log n); the entries it replaces, like those of cancelled timers, are
+    left in the heap and skipped when they come up (lazy cancellation).
+
+    Deadlines are kept as `time.monotonic()` values, unaffected by changes of
+    the system clock, and handed out as times since the epoch, which survive
+    a restart of the server.
+
+    The task is started on demand on the running event loop, and started
+    again if the timers are used from another loop (e.g. that of a test).
+
+    Attributes
+    ----------
+    on_expire : Callable[[int], Awaitable[None]]
+        Called with the ID of a game whose turn ran out. Its timer is stopped
+        by then: restarting it is up to the callback.
+    deadlines : dict[int, float]
+        The deadline of each game with a running timer, as a `time.monotonic()`.
+    heap : list[tuple[float, int, int]]
+        The (deadline, sequence number, game ID) of the timers started, some
+        of them stale.
+    task : asyncio.Task | None
+        The task waiting for the next deadline.
+    """
+
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self.deadlines : dict[int, float] = {}
+        self.heap : list[tuple[float, int, int]] = []
+        self.sequence = 0
+        self.task : asyncio.Task | None = None
+        self.wakeup : asyncio.Event | None = None
+
+    def __contains__(self, game_id : int):
+        return game_id in self.deadlines
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def start(self, game_id : int, duration : float = TURN_DURATION) -> float:
+        """
+        Starts the timer of a game, replacing the running one if any, so that
+        its turn runs out in `duration` seconds. Must be called from the event
+        loop. Returns the deadline as a time since the epoch, to be persisted
+        in `Game.turn_deadline`.
+        """
+        self.schedule(game_id, time.monotonic() + duration)
+        return time.time() + duration
+
+    def resume(self, game_id : int, deadline : float) -> None:
+        """
+        Starts the timer of a game so that its turn runs out at `deadline`, a
+        time since the epoch as returned by `start` (right away if it has
+        already passed). Used to restore the timers after a restart.
+        """
+        self.schedule(game_id, time.monotonic() + deadline - time.time())
+
+    def schedule(self, game_id : int, deadline : float) -> None:
+        self.sequence += 1
+        self.deadlines[game_id] = deadline
+        heapq.heappush(self.heap, (deadline, self.sequence, game_id))
+        self.ensure_running()
+        if self.heap[0][2] == game_id and self.wakeup is not None:
+            # The new deadline is the earliest one: the task must wait less
+            self.wakeup.set()
+
+    def cancel(self, game_id : int) -> None:
+        """Stops the timer of a game, if it is running."""
+        self.deadlines.pop(game_id, None)
+
+    def remaining(self, game_id : int) -> int | None:
+        """
+        Returns the whole seconds left in the current turn of a game, or None
+        if its timer isn't running.
+        """
+        deadline = self.deadlines.get(game_id)
+        if deadline is None:
+            return None
+        return max(0, math.ceil(deadline - time.monotonic()))
+
+    def deadline(self, game_id : int) -> float | None:
+        """
+        Returns the deadline of the current turn of a game as a time since the
+        epoch, or None if its timer isn't running.
+        """
+        deadline = self.deadlines.get(game_id)
+        if deadline is None:
+            return None
+        return time.time() + deadline - time.monotonic()
+
+    def ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        task = self.task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.run(self.wakeup))
+
+    async def run(self, wakeup : asyncio.Event) -> None:
+        """
+        Waits for the deadlines in order and calls `on_expire` for the games
+        whose timers are still running when they come.
+        """
+        while self.wakeup is wakeup:
+            # Drop the stale entries on top of the heap
+            while self.heap and self.deadlines.get(self.heap[0][2]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+            if timeout is None or timeout > 0:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except TimeoutError:
+                    pass
+                continue
+
+            deadline, _, game_id = heapq.heappop(self.heap)
+            del self.deadlines[game_id]
+            try:
+                await self.on_expire(game_id)
+            except Exception as e:
+                print(f"Turn timer of game {game_id} failed: {e!r}")
@@ -1,16 +1,16 @@
-from constants import FAILURE, STATUS, SUCCESS
+from constants import FAILURE, STATUS, SUCCESS, PAGE_INTERVAL
 from board_shapes import shapes_on_board
+from bitboard import Bitboard
 from orm import Game
 
-def is_valid_figure(board: str, fig: str, x: int, y: int):
+def is_valid_figure(board: str | Bitboard, fig: str, x: int, y: int):
 
     λ = shapes_on_board(board)
-    λ = [b for b in λ if b.shape_code == fig]
 
-    if len(λ) == 0:
+    if fig not in λ.masks:
         return {"message": f"The figure {fig} is not in the current board.",
                 STATUS: FAILURE}
-    if all( [ β.board[x][y] == 0 for β in λ] ):
+    if not λ.covers(fig, x, y):
         msg = f"""Figure {fig} exists in board, but not at ({x}, {y})"""
         return {"message": msg, STATUS: FAILURE}
 
@@ -25,6 +25,19 @@ def make_partial_moves_effective(game: Game, used_movs: str, player_id: int):
     game.commit_board()
 
 
+def page_with_cursor(games):
+    """
+    Takes the games of a page plus (at most) the first game of the following
+    page, sorted by ID, and returns the games of the page together with the
+    cursor to the next page: the ID of the last game of the page, or None if
+    there is no next page.
+    """
+    if len(games) <= PAGE_INTERVAL:
+        return games, None
+    games = games[:PAGE_INTERVAL]
+    return games, games[-1].id
+
+
 def search_is_valid(text, min, max):
     return (
         (text == "" or text.isalnum()) and